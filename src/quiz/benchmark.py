@@ -0,0 +1,329 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+PATH = './../../'  # path to the cs329 directory
+POS_DATA = PATH + 'dat/pos/wsj-pos.dev.gold.tsv'
+NER_DIR = PATH + 'dat/ner'
+
+# name -> (setup, required modules); setup(scale) returns (fn, items, units) where fn is timed on every item
+# and units is the total amount of work (e.g., tokens) that the throughput is reported in
+BENCHMARKS: Dict[str, Tuple[Callable[[int], Tuple[Callable, List, Tuple[int, str]]], Tuple[str, ...]]] = OrderedDict()
+
+
+def benchmark(name: str, requires: Sequence[str] = ()):
+    def register(setup):
+        BENCHMARKS[name] = (setup, tuple(requires))
+        return setup
+    return register
+
+
+def missing(requires: Sequence[str]) -> List[str]:
+    return [module for module in requires if importlib.util.find_spec(module) is None]
+
+
+@lru_cache(maxsize=None)
+def _pos_data() -> Tuple:
+    import quiz3
+    return tuple(quiz3.read_data(POS_DATA))
+
+
+def pos_sentences(scale: int = 1) -> List[List[Tuple[str, str]]]:
+    return list(_pos_data()) * scale
+
+
+def texts(scale: int = 1) -> List[str]:
+    return [' '.join(word for word, _ in sentence) for sentence in pos_sentences(scale)]
+
+
+# ======================================== quiz1 ========================================
+
+@benchmark('quiz1.normalize')
+def bench_normalize(scale: int):
+    import quiz1
+    items = texts(scale)
+
+    def fn(text):
+        # normalize() prints its output, which is not part of the measurement
+        with contextlib.redirect_stdout(io.StringIO()):
+            quiz1.normalize(text)
+
+    return fn, items, (sum(len(text) for text in items), 'chars')
+
+
+# ======================================== quiz2 ========================================
+
+SENSE_PAIRS = [('dog.n.01', 'cat.n.01'), ('car.n.01', 'bicycle.n.01'), ('teacher.n.01', 'student.n.01'), ('tree.n.01', 'flower.n.01'), ('run.v.01', 'walk.v.01')]
+SENSES = ['good.a.01', 'hot.a.01', 'happy.a.01', 'big.a.01', 'light.a.01', 'fast.a.01']
+
+
+@benchmark('quiz2.paths', requires=('nltk', 'numpy'))
+def bench_paths(scale: int):
+    import quiz2
+    quiz2.configure_cache(0)
+    items = SENSE_PAIRS * scale
+    return (lambda pair: quiz2.paths(*pair)), items, (len(items), 'pairs')
+
+
+@benchmark('quiz2.antonyms', requires=('nltk', 'numpy'))
+def bench_antonyms(scale: int):
+    import quiz2
+    quiz2.configure_cache(0)
+    items = SENSES * scale
+    return quiz2.antonyms, items, (len(items), 'senses')
+
+
+# ======================================== quiz3 ========================================
+
+@lru_cache(maxsize=None)
+def tagger_args() -> Tuple:
+    import quiz3
+    return quiz3.create_dictionaries(pos_sentences()) + quiz3.DEFAULT_WEIGHTS
+
+
+@benchmark('quiz3.create_dictionaries', requires=('numpy',))
+def bench_create_dictionaries(scale: int):
+    import quiz3
+    data = pos_sentences(scale)
+    return quiz3.create_dictionaries, [data], (sum(len(sentence) for sentence in data), 'tokens')
+
+
+@benchmark('quiz3.predict', requires=('numpy',))
+def bench_predict(scale: int):
+    import quiz3
+    args = tagger_args()
+    items = [[word for word, _ in sentence] for sentence in pos_sentences(scale)]
+    return (lambda tokens: quiz3.predict(tokens, *args)), items, (sum(len(tokens) for tokens in items), 'tokens')
+
+
+@benchmark('quiz3.evaluate', requires=('numpy',))
+def bench_evaluate(scale: int):
+    import quiz3
+    args = tagger_args()
+    data = pos_sentences(scale)
+
+    def fn(data):
+        with contextlib.redirect_stdout(io.StringIO()):
+            quiz3.evaluate(data, *args)
+
+    return fn, [data], (sum(len(sentence) for sentence in data), 'tokens')
+
+
+# ======================================== quiz5 ========================================
+
+def ner_documents(scale: int) -> List[List[str]]:
+    # sentences with gazetteer spans spliced in, so that every document has matches
+    import quiz5
+    spans = [span for span, _ in quiz5.gazetteer_data(NER_DIR)]
+    rand = random.Random(0)
+    documents = []
+    for sentence in pos_sentences(scale):
+        tokens = [word for word, _ in sentence]
+        for _ in range(3):
+            i = rand.randrange(len(tokens) + 1)
+            tokens[i:i] = rand.choice(spans).split()
+        documents.append(tokens)
+    return documents
+
+
+@benchmark('quiz5.create_ac', requires=('ahocorasick', 'numpy'))
+def bench_create_ac(scale: int):
+    import quiz5
+    data = list(quiz5.gazetteer_data(NER_DIR))
+    data = [('{} {}'.format(span, c), label) for c in range(10 * scale) for span, label in data]
+    return quiz5.create_ac, [data], (len(data), 'entries')
+
+
+@benchmark('quiz5.match', requires=('ahocorasick', 'numpy'))
+def bench_match(scale: int):
+    import quiz5
+    AC = quiz5.create_ac(quiz5.gazetteer_data(NER_DIR))
+    items = ner_documents(scale)
+    return (lambda tokens: quiz5.match(AC, tokens)), items, (sum(len(tokens) for tokens in items), 'tokens')
+
+
+@benchmark('quiz5.remove_overlaps', requires=('ahocorasick', 'numpy'))
+def bench_remove_overlaps(scale: int):
+    import quiz5
+    items = [quiz5.random_entities(1000, seed=seed) for seed in range(20 * scale)]
+    # remove_overlaps() sorts its input in place, so every call gets a copy
+    return (lambda entities: quiz5.remove_overlaps(list(entities))), items, (sum(len(entities) for entities in items), 'spans')
+
+
+@benchmark('quiz5.to_bilou', requires=('ahocorasick', 'numpy'))
+def bench_to_bilou(scale: int):
+    import quiz5
+    AC = quiz5.create_ac(quiz5.gazetteer_data(NER_DIR))
+    items = []
+    for tokens in ner_documents(scale):
+        entities = quiz5.remove_overlaps(quiz5.match(AC, tokens))
+        items.append((tokens, [(span, s, e, min(values)) for span, s, e, values in entities]))
+    return (lambda item: quiz5.to_bilou(*item)), items, (sum(len(tokens) for tokens, _ in items), 'tokens')
+
+
+# ======================================== Runner ========================================
+
+def _timed_run(fn: Callable, items: List) -> Tuple[float, List[float]]:
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t)
+    return time.perf_counter() - start, latencies
+
+
+def measure(fn: Callable, items: List, units: Tuple[int, str], memory: bool = True, repeat: int = 5, warmup: int = 1) -> Dict[str, Any]:
+    """
+    Runs fn on every item `warmup` times untimed (e.g., to fill caches and load lazy imports), times `repeat` runs,
+    then runs it again under tracemalloc for the peak memory, so that tracing does not slow down the timed runs.
+    Every metric is the median over the timed runs, which a single slow run (e.g., a garbage collection) does not move.
+    :param memory: if False, skips the traced run, which takes several times longer than a timed one.
+    :param repeat: the number of timed runs.
+    :param warmup: the number of untimed runs before them.
+    """
+    from quiz3 import percentiles
+    for _ in range(warmup):
+        for item in items:
+            fn(item)
+
+    runs = [_timed_run(fn, items) for _ in range(max(1, repeat))]
+    seconds = [s for s, _ in runs]
+    latencies = [percentiles(latencies) for _, latencies in runs]
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        for item in items:
+            fn(item)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    result = OrderedDict([
+        ('items', len(items)),
+        ('units', units[0]),
+        ('unit', units[1]),
+        ('repeat', len(runs)),
+        ('seconds', statistics.median(seconds)),
+        ('seconds_min', min(seconds)),
+        ('throughput', statistics.median(units[0] / s if s else 0.0 for s in seconds)),
+    ])
+    result.update(('latency_' + p, statistics.median(run[p] for run in latencies) * 1000) for p in latencies[0])
+    result['peak_mb'] = peak / 2 ** 20 if memory else None
+    return result
+
+
+def run(names: Optional[Sequence[str]] = None, scale: int = 1, memory: bool = True, repeat: int = 5, warmup: int = 1) -> Dict[str, Any]:
+    """
+    :param names: the benchmarks to run (default: all); those whose required modules are missing are skipped.
+    :param scale: how many times the bundled data is repeated (or scaled) for every benchmark.
+    :param memory: if False, peak memory is not measured.
+    :param repeat: the number of timed runs of every benchmark, whose medians are reported.
+    :param warmup: the number of untimed runs of every benchmark before the timed ones.
+    :return: the results with the environment they were measured in.
+    """
+    results = OrderedDict()
+    for name in names or BENCHMARKS:
+        setup, requires = BENCHMARKS[name]
+        absent = missing(requires)
+        if absent:
+            results[name] = {'skipped': 'missing ' + ', '.join(absent)}
+            print('{:<28} skipped: missing {}'.format(name, ', '.join(absent)), file=sys.stderr)
+            continue
+
+        try:
+            fn, items, units = setup(scale)
+            results[name] = measure(fn, items, units, memory, repeat, warmup)
+        except LookupError as e:
+            # e.g., NLTK is installed without the WordNet data, which quiz2 loads on the first query
+            results[name] = {'skipped': str(e).strip().splitlines()[0]}
+            print('{:<28} skipped: {}'.format(name, results[name]['skipped']), file=sys.stderr)
+            continue
+
+        print('{:<28} {throughput:>14,.0f} {unit}/sec  p50 {latency_p50:.3f} ms  p99 {latency_p99:.3f} ms'.format(name, **results[name]) + ('  peak {:.2f} MB'.format(results[name]['peak_mb']) if memory else ''), file=sys.stderr)
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'scale': scale,
+        'repeat': repeat,
+        'warmup': warmup,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'benchmarks': results,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2) -> List[str]:
+    """
+    :param tolerance: the relative change allowed before a metric counts as a regression.
+    :return: a message for every metric that regressed from the baseline: lower throughput, or higher latency or peak memory.
+             Timings are compared by their medians over the repeated runs of each side.
+    """
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        base = baseline.get('benchmarks', {}).get(name)
+        if 'skipped' in result or not base or 'skipped' in base: continue
+
+        for metric in ('throughput', 'latency_p50', 'latency_p99', 'peak_mb'):
+            new, old = result[metric], base[metric]
+            if new is None or old is None: continue
+            worse = new < old * (1 - tolerance) if metric == 'throughput' else new > old * (1 + tolerance)
+            if worse:
+                regressions.append('{}: {} {:.4g} -> {:.4g} ({:+.1%})'.format(name, metric, old, new, new / old - 1 if old else float('inf')))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('names', nargs='*', help='the benchmarks to run (default: all): ' + ', '.join(BENCHMARKS))
+    parser.add_argument('-s', '--scale', type=int, default=1, help='how many times the bundled data is scaled up')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='the JSON file the results are saved to')
+    parser.add_argument('-b', '--baseline', help='a JSON file of earlier results to compare against')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='the number of timed runs of every benchmark, whose medians are reported')
+    parser.add_argument('-w', '--warmup', type=int, default=1, help='the number of untimed runs of every benchmark before the timed ones')
+    parser.add_argument('--no-memory', action='store_true', help='skips the tracemalloc run that measures peak memory')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2, help='the relative change allowed before flagging a regression')
+    options = parser.parse_args()
+
+    unknown = [name for name in options.names if name not in BENCHMARKS]
+    if unknown: parser.error('unknown benchmarks: ' + ', '.join(unknown))
+
+    results = run(options.names, options.scale, not options.no_memory, options.repeat, options.warmup)
+    with open(options.output, 'w') as fout:
+        json.dump(results, fout, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as fin:
+            regressions = compare(results, json.load(fin), options.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression, file=sys.stderr)
+        if regressions: sys.exit(1)
@@ -0,0 +1,218 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import argparse
+import json
+import random
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+PATH = './../../'  # path to the cs329 directory
+POS_DATA = PATH + 'dat/pos/wsj-pos.dev.gold.tsv'
+NER_DIR = PATH + 'dat/ner'
+FRACTIONS = (0.125, 0.25, 0.5, 1.0)
+
+
+def deep_size(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """
+    :param obj: a Python object, e.g., a quiz3 feature table or a quiz5 automaton.
+    :param seen: the ids of the objects already counted, which are not counted again (e.g., interned tags shared by entries).
+    :return: the number of bytes held by the object and everything it references. An Aho-Corasick automaton counts
+             its trie (get_stats()['total_size']) and, when it stores Python objects, its values.
+    """
+    if seen is None: seen = set()
+    if id(obj) in seen: return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(deep_size(item, seen) for item in obj)
+    if isinstance(obj, np.ndarray):
+        return size if obj.base is None else size + deep_size(obj.base, seen)
+    if hasattr(obj, 'get_stats') and hasattr(obj, 'iter'):
+        import ahocorasick
+        size += obj.get_stats()['total_size']
+        if obj.store == ahocorasick.STORE_ANY:
+            size += sum(deep_size(value, seen) for value in obj.values())
+        return size
+    if hasattr(obj, '__dict__'):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def fit_growth(sizes: Sequence[float], nbytes: Sequence[float]) -> Tuple[float, float]:
+    """
+    Fits nbytes = a * size ^ b by least squares in log-log space.
+    :return: (a, b), where b is the growth exponent: 1 for linear growth, less for sublinear growth such as vocabularies.
+    """
+    b, log_a = np.polyfit(np.log(sizes), np.log(nbytes), 1)
+    return float(np.exp(log_a)), float(b)
+
+
+def project(fit: Tuple[float, float], size: float) -> float:
+    a, b = fit
+    return a * size ** b
+
+
+# ======================================== quiz3 ========================================
+
+def table_report(tables: Sequence[Any]) -> List[Dict[str, Any]]:
+    """
+    :param tables: the 14 feature tables returned by quiz3.create_dictionaries(), in the order of quiz3.FEATURES.
+    :return: for each table, the number of keys, the number of (pos, prob) values, and its deep size in bytes.
+    """
+    import quiz3
+    report = []
+    for feature, arity, table in zip(quiz3.FEATURES, quiz3.ARITIES, tables):
+        if arity:
+            keys, values = len(table), sum(len(entries) for entries in table.values())
+        else:
+            keys, values = 0, len(table)
+        nbytes = deep_size(table)
+        report.append(OrderedDict([('feature', feature), ('keys', keys), ('values', values), ('bytes', nbytes), ('bytes_per_value', nbytes / values if values else 0.0)]))
+    return report
+
+
+def tagger_growth(data: List[List[Tuple[str, str]]], fractions: Sequence[float] = FRACTIONS, target: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Measures the tables created from growing prefixes of the shuffled sentences and fits each table's growth curve.
+    :param data: the sentences.
+    :param fractions: the fractions of the sentences sampled.
+    :param target: if given, the number of tokens to project the memory of every table to.
+    :return: the samples (tokens -> bytes per table), the fits per table, and the projection if a target is given.
+    """
+    import quiz3
+    data = list(data)
+    random.Random(0).shuffle(data)
+
+    samples = []
+    for fraction in fractions:
+        sample = data[:max(1, int(len(data) * fraction))]
+        tables = quiz3.create_dictionaries(sample)
+        samples.append((sum(len(sentence) for sentence in sample), [row['bytes'] for row in table_report(tables)]))
+
+    return _growth(samples, quiz3.FEATURES, target, 'tokens')
+
+
+# ======================================== quiz5 ========================================
+
+def label_report(data: Iterable[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """
+    :param data: the (span, label) pairs of the gazetteers, e.g., from quiz5.gazetteer_data().
+    :return: for each label, the number of spans and of automaton nodes, and the bytes of a create_ac() automaton
+             over that label alone (trie and values). Labels share trie prefixes and namespaces of spans listed under
+             several labels, so the total row, which measures the automaton over all labels, can be less than their sum.
+    """
+    import quiz5
+    data = list(data)
+    labels = OrderedDict()
+    for span, label in data:
+        labels.setdefault(label, []).append((span, label))
+
+    report = []
+    for label, pairs in list(labels.items()) + [('(total)', data)]:
+        AC = quiz5.create_ac(pairs)
+        stats = AC.get_stats()
+        nbytes = deep_size(AC)
+        report.append(OrderedDict([('label', label), ('spans', stats['words_count']), ('nodes', stats['nodes_count']), ('trie_bytes', stats['total_size']), ('bytes', nbytes), ('bytes_per_span', nbytes / stats['words_count'] if stats['words_count'] else 0.0)]))
+    return report
+
+
+def gazetteer_growth(data: Iterable[Tuple[str, str]], fractions: Sequence[float] = FRACTIONS, target: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Measures the create_ac() automata over growing samples of the shuffled gazetteer entries and fits their growth curves.
+    :param data: the (span, label) pairs of the gazetteers.
+    :param fractions: the fractions of the entries sampled.
+    :param target: if given, the total number of entries to project the memory of every label to, assuming the same mix of labels.
+    :return: the samples (entries -> bytes per label), the fits per label, and the projection if a target is given.
+    """
+    data = list(data)
+    random.Random(0).shuffle(data)
+    labels = sorted({label for _, label in data})
+
+    samples = []
+    for fraction in fractions:
+        sample = data[:max(1, int(len(data) * fraction))]
+        rows = {row['label']: row['bytes'] for row in label_report(sample)}
+        samples.append((len(sample), [rows.get(label, 0) for label in labels] + [rows['(total)']]))
+
+    return _growth(samples, labels + ['(total)'], target, 'entries')
+
+
+def _growth(samples: List[Tuple[int, List[int]]], names: Sequence[str], target: Optional[int], unit: str) -> Dict[str, Any]:
+    sizes = [size for size, _ in samples]
+    fits = OrderedDict()
+    for i, name in enumerate(names):
+        nbytes = [row[i] for _, row in samples]
+        # a part that is empty in some sample (e.g., a rare label) cannot be fit in log space
+        fits[name] = fit_growth(sizes, nbytes) if all(nbytes) else None
+
+    growth = OrderedDict([('unit', unit), ('samples', [OrderedDict([(unit, size)] + list(zip(names, row))) for size, row in samples]), ('fits', fits)])
+    if target:
+        growth['target'] = target
+        growth['projection'] = OrderedDict((name, project(fit, target) if fit else None) for name, fit in fits.items())
+    return growth
+
+
+# ======================================== CLI ========================================
+
+def _print_rows(rows: List[Dict[str, Any]], name: str):
+    print('{:>18} {:>10} {:>12} {:>14} {:>10}'.format(name, 'keys' if name == 'feature' else 'spans', 'values' if name == 'feature' else 'nodes', 'bytes', 'bytes/val'))
+    for row in rows:
+        counts = (row['keys'], row['values']) if name == 'feature' else (row['spans'], row['nodes'])
+        per = row['bytes_per_value'] if name == 'feature' else row['bytes_per_span']
+        print('{:>18} {:>10,} {:>12,} {:>14,} {:>10.1f}'.format(row[name], counts[0], counts[1], row['bytes'], per))
+
+
+def _print_growth(growth: Dict[str, Any]):
+    print('\ngrowth over {} {}:'.format(', '.join('{:,}'.format(s[growth['unit']]) for s in growth['samples']), growth['unit']))
+    for name, fit in growth['fits'].items():
+        line = '{:>18}: bytes = {:.4g} * {}^{:.3f}'.format(name, fit[0], growth['unit'], fit[1]) if fit else '{:>18}: (not enough samples)'.format(name)
+        if 'projection' in growth and growth['projection'][name] is not None:
+            line += ' -> {:,.1f} MB at {:,} {}'.format(growth['projection'][name] / 2 ** 20, growth['target'], growth['unit'])
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('target', choices=('quiz3', 'quiz5'), help='reports the quiz3 feature tables or the quiz5 gazetteer automata')
+    parser.add_argument('-p', '--project', type=int, metavar='SIZE', help='projects the memory to SIZE tokens (quiz3) or gazetteer entries (quiz5)')
+    parser.add_argument('-o', '--output', help='saves the report as JSON')
+    options = parser.parse_args()
+
+    if options.target == 'quiz3':
+        import quiz3
+        data = quiz3.read_data(POS_DATA)
+        rows, name = table_report(quiz3.create_dictionaries(data)), 'feature'
+        growth = tagger_growth(data, target=options.project)
+    else:
+        import quiz5
+        data = list(quiz5.gazetteer_data(NER_DIR))
+        rows, name = label_report(data), 'label'
+        growth = gazetteer_growth(data, target=options.project)
+
+    _print_rows(rows, name)
+    _print_growth(growth)
+
+    if options.output:
+        with open(options.output, 'w') as fout:
+            json.dump({'report': rows, 'growth': growth}, fout, indent=2)
@@ -0,0 +1,253 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from queue import Queue, Empty, Full
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import quiz1
+import quiz3
+import quiz5
+
+WORKERS = (None, 'thread', 'process')
+
+
+class Stage:
+    """
+    One step of a Pipeline: fn maps a batch (list) of documents to a batch of the same length.
+    With worker='process', fn, initializer and initargs must be picklable (module-level functions), and the
+    initializer runs once in the stage's worker process; otherwise, it runs once in this process.
+    """
+
+    def __init__(self, name: str, fn: Callable[[List], List], worker: Optional[str] = None, initializer: Optional[Callable] = None, initargs: Tuple = ()):
+        if worker not in WORKERS:
+            raise ValueError('worker must be one of {}: {}'.format(WORKERS, worker))
+        self.name = name
+        self.fn = fn
+        self.worker = worker
+        self.initializer = initializer
+        self.initargs = initargs
+
+
+def _timed(fn: Callable[[List], List], batch: List) -> Tuple[List, float]:
+    start = time.perf_counter()
+    return fn(batch), time.perf_counter() - start
+
+
+_DONE = object()
+
+
+class Pipeline:
+    """
+    Chains stages as lazy generators over a stream of documents. Documents move in batches, and at most queue_size
+    batches wait between a stage on a worker and the next stage, so memory is bounded by the batch and queue sizes,
+    not the corpus size. Each stage records its batches, documents and seconds spent in fn.
+    """
+
+    def __init__(self, stages: Sequence[Stage], batch_size: int = 64, queue_size: int = 8):
+        self.stages = stages
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.stats: Dict[str, List] = OrderedDict((stage.name, [0, 0, 0.0]) for stage in stages)
+        self.seconds = 0.0
+
+    def run(self, documents: Iterable[Any]) -> Iterator[Any]:
+        """
+        :param documents: a stream of inputs to the first stage.
+        :return: the outputs of the last stage, in the order of the documents.
+        """
+        start = time.perf_counter()
+        batches = quiz1.read_chunks(documents, self.batch_size)
+
+        for stage in self.stages:
+            if stage.worker == 'process':
+                batches = self._process(stage, batches)
+            elif stage.worker == 'thread':
+                batches = self._thread(stage, batches)
+            else:
+                batches = self._inline(stage, batches)
+
+        try:
+            for batch in batches:
+                yield from batch
+        finally:
+            batches.close()
+            self.seconds += time.perf_counter() - start
+
+    def _record(self, stage: Stage, batch: List, seconds: float):
+        stats = self.stats[stage.name]
+        stats[0] += 1
+        stats[1] += len(batch)
+        stats[2] += seconds
+
+    def _inline(self, stage: Stage, batches: Iterator[List]) -> Iterator[List]:
+        if stage.initializer: stage.initializer(*stage.initargs)
+        for batch in batches:
+            out, seconds = _timed(stage.fn, batch)
+            self._record(stage, out, seconds)
+            yield out
+
+    def _thread(self, stage: Stage, batches: Iterator[List]) -> Iterator[List]:
+        # the thread pulls from the upstream stages, so they run on it as well unless they have their own workers
+        queue, stop = Queue(self.queue_size), threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return
+                except Full:
+                    pass
+
+        def work():
+            try:
+                for out in self._inline(stage, batches):
+                    put(out)
+                    if stop.is_set(): break
+            except BaseException as e:
+                put(e)
+            put(_DONE)
+
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                item = queue.get()
+                if item is _DONE: break
+                if isinstance(item, BaseException): raise item
+                yield item
+        finally:
+            stop.set()
+            while thread.is_alive():
+                try:
+                    queue.get(timeout=0.1)
+                except Empty:
+                    pass
+
+    def _process(self, stage: Stage, batches: Iterator[List]) -> Iterator[List]:
+        for out, seconds in quiz1.map_ordered(partial(_timed, stage.fn), batches, 1, stage.initializer, stage.initargs, self.queue_size):
+            self._record(stage, out, seconds)
+            yield out
+
+    def report(self) -> List[Dict[str, Any]]:
+        return [{
+            'stage': name,
+            'batches': batches,
+            'documents': documents,
+            'seconds': seconds,
+            'docs_per_sec': documents / seconds if seconds else 0.0,
+        } for name, (batches, documents, seconds) in self.stats.items()]
+
+    def print(self, file=sys.stderr):
+        for row in self.report():
+            print('{stage:>10}: {documents:>10,} docs {seconds:>8.2f} sec {docs_per_sec:>10,.0f} docs/sec'.format(**row), file=file)
+        print('{:>10}: {:>28.2f} sec'.format('wall', self.seconds), file=file)
+
+
+# ======================================== Stages ========================================
+
+_model: Optional[Tuple] = None
+_gazetteers: Optional[quiz5.Gazetteers] = None
+
+
+def init_tagger(model_path: str):
+    global _model
+    _model = quiz3.load_args(model_path)
+
+
+def init_ner(dirname: str, cache: Optional[str] = None, normalize: bool = False):
+    global _gazetteers
+    _gazetteers = quiz5.read_gazetteers(dirname, cache, normalize)
+
+
+def tokenize(texts: List[str]) -> List[List[str]]:
+    # quiz1.tokenizer() keeps whitespace and empty pieces, which are not tokens
+    return [[token for token in quiz1.tokenizer(text) if token.strip()] for text in texts]
+
+
+def tag(documents: List[List[str]]) -> List[Tuple[List[str], List[str]]]:
+    return [(tokens, [pos for pos, _ in quiz3.predict(tokens, *_model)]) for tokens in documents]
+
+
+def ner(documents: List[Tuple[List[str], List[str]]]) -> List[Dict[str, List[str]]]:
+    out = []
+    for tokens, pos in documents:
+        entities = quiz5.remove_overlaps(quiz5.match(_gazetteers, tokens))
+        # a span listed in several gazetteers is tagged with the first of its labels in sorted order
+        entities = [(span, s, e, min(values)) for span, s, e, values in entities]
+        out.append({'tokens': tokens, 'pos': pos, 'ner': quiz5.to_bilou(tokens, entities)})
+    return out
+
+
+def create_pipeline(model_path: str, gaz_dir: str, cache: Optional[str] = None, normalize: bool = False, workers: Sequence[Optional[str]] = (None, None, None), batch_size: int = 64, queue_size: int = 8) -> Pipeline:
+    """
+    :param model_path: the quiz3 model passed to quiz3.load_args().
+    :param gaz_dir: the gazetteer directory passed to quiz5.read_gazetteers().
+    :param cache: the gazetteer cache passed to quiz5.read_gazetteers().
+    :param normalize: if True, gazetteers are matched case-insensitively after Unicode normalization.
+    :param workers: the worker (None, 'thread' or 'process') of the tokenize, tag and ner stages.
+    :return: a pipeline from texts to {'tokens', 'pos', 'ner'} with BILOU named entity tags.
+    """
+    return Pipeline([
+        Stage('tokenize', tokenize, workers[0]),
+        Stage('tag', tag, workers[1], init_tagger, (model_path,)),
+        Stage('ner', ner, workers[2], init_ner, (gaz_dir, cache, normalize)),
+    ], batch_size, queue_size)
+
+
+def pos_texts(filename: str, repeat: int = 1) -> Iterator[str]:
+    """
+    :return: the sentences of a quiz3 TSV file, each joined into a text, read lazily `repeat` times.
+    """
+    for _ in range(repeat):
+        for sentence in quiz3.iter_data(filename):
+            yield ' '.join(word for word, _ in sentence)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', nargs='?', help='a text file with one document per line (default: the quiz3 dev sentences)')
+    parser.add_argument('-o', '--output', help='the JSON lines output (default: none, only the timing report)')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='the number of times the input is streamed')
+    parser.add_argument('-m', '--model', default='quiz3.pkl', help='the quiz3 model')
+    parser.add_argument('-g', '--gazetteers', default='./../../dat/ner', help='the quiz5 gazetteer directory')
+    parser.add_argument('--cache', help='the quiz5 gazetteer cache')
+    parser.add_argument('-n', '--normalize', action='store_true', help='matches gazetteers case-insensitively after Unicode normalization')
+    parser.add_argument('-w', '--workers', nargs=3, default=['none'] * 3, choices=('none', 'thread', 'process'), metavar='WORKER', help='the worker of the tokenize, tag and ner stages: none, thread or process')
+    parser.add_argument('-b', '--batch-size', type=int, default=64, help='the number of documents per batch')
+    parser.add_argument('-q', '--queue-size', type=int, default=8, help='the maximum number of batches waiting between stages')
+    options = parser.parse_args()
+
+    if options.input:
+        texts = (line.rstrip('\n') for _ in range(options.repeat) for line in open(options.input))
+    else:
+        texts = pos_texts('./../../dat/pos/wsj-pos.dev.gold.tsv', options.repeat)
+
+    workers = [None if w == 'none' else w for w in options.workers]
+    pipeline = create_pipeline(options.model, options.gazetteers, options.cache, options.normalize, workers, options.batch_size, options.queue_size)
+    fout = open(options.output, 'w') if options.output else None
+
+    for document in pipeline.run(texts):
+        if fout: fout.write(json.dumps(document) + '\n')
+
+    if fout: fout.close()
+    pipeline.print()
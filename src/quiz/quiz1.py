@@ -14,7 +14,14 @@
 # limitations under the License.
 # ========================================================================
 
+import argparse
+import os
 import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 values = {
   "one": 1,
@@ -51,40 +58,45 @@ values = {
   "trillion": 1000000000000
 }
 
+SPLIT = re.compile(r"(\W)")
+STARTS = ("'",)
+ENDS = (",", ".", "'")
+
+
+@lru_cache(maxsize=65536)
+def split_piece(piece):
+  # peels STARTS off the front and ENDS off the back in the same order as the former recursive aux()
+  head, tail = [], []
+
+  # every entry of STARTS and ENDS is a single character, so one membership test per side finds it
+  while True:
+    if piece[:1] in STARTS:
+      head.append(piece[0])
+      piece = piece[1:]
+    elif piece[-1:] in ENDS:
+      tail.append(piece[-1])
+      piece = piece[:-1]
+    else:
+      break
+
+  head.append(piece)
+  head.extend(reversed(tail))
+  return tuple(head)
+
+
 def tokenizer(text):
-  raw_tokens = re.split(r"(\W)", text)
   new_tokens = []
 
-  STARTS = ["'"]
-  ENDS = [",", ".", "'"]
-
-  def aux(token):
-    start = next((s for s in STARTS if token.startswith(s)), None)
-    if start:
-      n = len(start)
-      t1 = token[:n]
-      t2 = token[n:]
-      new_tokens.append(t1)
-      aux(t2)
-      return
-
-    end = next((e for e in ENDS if token.endswith(e)), None)
-    if end:
-      n = len(end)
-      t1 = token[:-n]
-      t2 = token[-n:]
-      aux(t1)
-      new_tokens.append(t2)
-      return
-
-    new_tokens.append(token)
-
-  for token in raw_tokens:
-    aux(token)
+  for piece in SPLIT.split(text):
+    new_tokens.extend(split_piece(piece))
 
   return new_tokens
 
 
+def tokenize_batch(texts):
+  return [tokenizer(text) for text in texts]
+
+
 def convert(number):
   multiple = 0
   result = 0
@@ -105,20 +117,16 @@ def convert(number):
   return str(result + multiple)
 
 
-def normalize(text):
-  # split tokens at space, period or hyphen
+def normalize_tokens(tokens):
+  # one pass with lookahead: tokens wait in a queue until the next
+  # non-delimiter token, which is the `after` of every token in the queue
   delimiter = re.compile(r"\W")
-  tokens = tokenizer(text)
-  length = len(tokens)
-
   number = []
-  output = []
-  index = 0
+  queue = []
 
-  while index < length:
-    token = tokens[index]
+  def step(token, after):
+    nonlocal number
     lower = token.lower()
-    after = next((x for x in tokens[index + 1:] if not delimiter.match(x)), None)
 
     if lower in values:
       number.append(lower)
@@ -127,24 +135,41 @@ def normalize(text):
       number.append("one")
 
     elif number and after not in values:
-      output.append(convert(number))
-      output.append(token)
+      yield convert(number)
+      yield token
       number = []
 
     elif delimiter.match(token):
       if not number:
-        output.append(token)
+        yield token
 
     else:
-      output.append(token)
+      yield token
+
+  for token in tokens:
+    if not delimiter.match(token):
+      for waiting in queue:
+        yield from step(waiting, token)
+      queue = []
+    queue.append(token)
 
-    index += 1
+  for waiting in queue:
+    yield from step(waiting, None)
 
   if number:
-    output.append(convert(number))
+    yield convert(number)
+
 
-  print("".join(output))
-  return "".join(output)
+def normalize_stream(lines):
+  # lazily normalizes an iterable of lines (e.g., an open file), one line at a time
+  for line in lines:
+    yield "".join(normalize_tokens(tokenizer(line)))
+
+
+def normalize(text):
+  output = "".join(normalize_tokens(tokenizer(text)))
+  print(output)
+  return output
 
 
 def normalize_extra(text):
@@ -152,7 +177,67 @@ def normalize_extra(text):
   return text
 
 
-if __name__ == '__main__':
+def read_chunks(fin, chunk_size):
+  chunk = []
+
+  for line in fin:
+    chunk.append(line)
+    if len(chunk) == chunk_size:
+      yield chunk
+      chunk = []
+
+  if chunk:
+    yield chunk
+
+
+def map_ordered(fn, items, processes=None, initializer=None, initargs=(), ahead=None):
+  """
+  Applies fn to the items in a process pool and yields the results in the order of the items.
+  At most `ahead` items (default: 2 per process) are submitted but not yet yielded, so memory is bounded
+  by the item size, not the length of the stream.
+  """
+  processes = processes or os.cpu_count() or 1
+  ahead = ahead or 2 * processes
+  pending = deque()
+
+  with ProcessPoolExecutor(processes, initializer=initializer, initargs=initargs) as pool:
+    for item in items:
+      if len(pending) >= ahead:
+        yield pending.popleft().result()
+      pending.append(pool.submit(fn, item))
+
+    while pending:
+      yield pending.popleft().result()
+
+
+def normalize_chunk(lines):
+  return "".join(normalize_stream(lines))
+
+
+def _normalize_counted(lines):
+  return len(lines), normalize_chunk(lines)
+
+
+def normalize_file(input_path, output_path, processes=None, chunk_size=10000, report_every=10.0):
+  lines = 0
+  start = last = time.time()
+
+  with open(input_path) as fin, open(output_path, 'w') as fout:
+    for n, text in map_ordered(_normalize_counted, read_chunks(fin, chunk_size), processes):
+      fout.write(text)
+      lines += n
+
+      now = time.time()
+      if now - last >= report_every:
+        print('{:,} lines, {:,.0f} lines/sec'.format(lines, lines / (now - start)), file=sys.stderr)
+        last = now
+
+  elapsed = time.time() - start
+  print('{:,} lines in {:.2f} sec, {:,.0f} lines/sec'.format(lines, elapsed, lines / elapsed if elapsed else 0.0), file=sys.stderr)
+  return lines, elapsed
+
+
+def demo():
   S = [
     'I met twelve people',
     'I have one brother and two sisters',
@@ -175,3 +260,17 @@ if __name__ == '__main__':
       correct += 1
 
   print('Score: {}/{}'.format(correct, len(S)))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Normalizes number words in a text file using a process pool.')
+  parser.add_argument('input', nargs='?', help='input text file; runs the demo if omitted')
+  parser.add_argument('-o', '--output', help='output file (default: INPUT.norm)')
+  parser.add_argument('-p', '--processes', type=int, default=None, help='number of worker processes (default: #cpus)')
+  parser.add_argument('-c', '--chunk-size', type=int, default=10000, help='number of lines per chunk')
+  args = parser.parse_args()
+
+  if args.input:
+    normalize_file(args.input, args.output or args.input + '.norm', args.processes, args.chunk_size)
+  else:
+    demo()
@@ -22,22 +22,571 @@
 # else:
 #     ssl._create_default_https_context = _create_unverified_https_context
 
-from typing import Set, Optional, List
-from nltk.corpus.reader import Synset
-from nltk.corpus import wordnet as wn
+from __future__ import annotations
+
+import argparse
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import time
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from itertools import chain, count
+from typing import Set, Optional, List, Tuple, Dict, Iterable, Sequence, Any, Hashable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+  import numpy as np
+  from nltk.corpus.reader import Synset
 
 # import nltk
 # nltk.download('wordnet')
 
 
-def antonyms(sense: str) -> Set[Synset]:
+_wordnet = None
+
+
+def wordnet():
+  """
+  :return: the WordNet corpus reader; NLTK is imported on the first call so that importing this module stays cheap.
+  """
+  global _wordnet
+  if _wordnet is None:
+    from nltk.corpus import wordnet as wn
+    _wordnet = wn
+  return _wordnet
+
+
+INDEX_MAGIC = b'WNHI'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4s6I')
+
+SNAPSHOT_MAGIC = b'WNSS'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4s6I')
+
+
+class SnapshotSynset:
+  """
+  A lightweight stand-in for an NLTK Synset returned by :func:`antonyms` and :func:`paths` with a :class:`WordNetSnapshot`, so that
+  answering from a snapshot never loads WordNet. Like a Synset, it is identified, hashed, and ordered by its name, so it compares equal
+  to the Synset of the same name.
+  """
+
+  __slots__ = ('_name',)
+
+  def __init__(self, name: str):
+    self._name = name
+
+  def name(self) -> str:
+    return self._name
+
+  def __eq__(self, other) -> bool:
+    return self._name == getattr(other, '_name', None)
+
+  def __lt__(self, other) -> bool:
+    return self._name < other._name
+
+  def __hash__(self) -> int:
+    return hash(self._name)
+
+  def __repr__(self) -> str:
+    return "Synset('{}')".format(self._name)
+
+
+_GRAPH_KEYS = count(1)
+
+
+class SynsetGraph(ABC):
+  """
+  The queries shared by :class:`HypernymIndex` and :class:`WordNetSnapshot`.
+  Synsets are identified by integer IDs assigned in the order of their names; a hypernym path is a tuple of IDs from the root to the synset.
+  """
+
+  def __init__(self, filename: str, header: struct.Struct, magic: bytes, version: int):
+    # unique within the process, unlike id(), so cached results of a discarded graph are never served for a new one
+    self.cache_key = next(_GRAPH_KEYS)
+    with open(filename, 'rb') as fin:
+      self._mm = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+
+    fields = header.unpack_from(self._mm)
+    if fields[0] != magic or fields[1] != version:
+      raise ValueError('{} is not a {} (version {})'.format(filename, type(self).__name__, version))
+
+    self.counts = fields[2:-1]
+    names_len = fields[-1]
+    offset = _align(header.size)
+    self.names = self._mm[offset:offset + names_len].decode('utf-8').split('\n')
+    self.ids = {name: i for i, name in enumerate(self.names)}
+    self._view = memoryview(self._mm)
+    self._offset = _align(offset + names_len)
+
+  def _section(self, size: int) -> memoryview:
+    offset, self._offset = self._offset, self._offset + 4 * size
+    return self._view[offset:self._offset].cast('i')
+
+  def __len__(self) -> int:
+    return len(self.names)
+
+  @abstractmethod
+  def synset(self, name: str) -> Synset:
+    """
+    :param name: the ID of a sense (e.g., 'dog.n.01').
+    :return: the object representing the sense in the results of :func:`antonyms` and :func:`paths`.
+    """
+
+  @abstractmethod
+  def max_depth(self, synset_id: int) -> int:
+    pass
+
+  @abstractmethod
+  def hypernym_paths(self, synset_id: int) -> List[Tuple[int, ...]]:
+    """
+    :param synset_id: the ID of a synset.
+    :return: the hypernym paths of the synset, each from the root to the synset.
+    """
+
+  @abstractmethod
+  def antonyms(self, sense: str) -> Set[str]:
+    """
+    :param sense: the ID of the sense (e.g., 'dog.n.01').
+    :return: the IDs of the senses returned by :func:`antonyms`.
+    """
+
+  def lowest_common_hypernyms(self, paths_0: List[Tuple[int, ...]], paths_1: List[Tuple[int, ...]]) -> List[int]:
+    common = set(chain.from_iterable(paths_0)).intersection(chain.from_iterable(paths_1))
+    if not common: return []
+    depths = {c: self.max_depth(c) for c in common}
+    max_depth = max(depths.values())
+    # IDs follow the name order, so this is the same order as sorted(Synset)
+    return sorted(c for c, d in depths.items() if d == max_depth)
+
+  def paths(self, sense_0: str, sense_1: str) -> List[List[str]]:
+    """
+    :param sense_0: the ID of the first sense (e.g., 'dog.n.01').
+    :param sense_1: the ID of the second sense (e.g., 'cat.n.01').
+    :return: the same paths as :func:`paths`, where each synset is represented by its ID.
+    """
+    paths_0 = self.hypernym_paths(self.ids[sense_0])
+    paths_1 = self.hypernym_paths(self.ids[sense_1])
+    lchs = self.lowest_common_hypernyms(paths_0, paths_1)
+    tails_0 = _tails(paths_0, lchs)
+    tails_1 = _tails(paths_1, lchs)
+    result = []
+
+    for lch in lchs:
+      for path_0 in tails_0[lch]:
+        for path_1 in tails_1[lch]:
+          result.append([self.names[k] for k in path_0[::-1] + path_1[1:]])
+
+    return result
+
+
+class HypernymIndex(SynsetGraph):
+  """
+  A read-only, memory-mapped index created by :func:`build_index` that stores the hypernym paths and max depths of all synsets.
+  """
+
+  def __init__(self, filename: str):
+    super().__init__(filename, INDEX_HEADER, INDEX_MAGIC, INDEX_VERSION)
+    n_synsets, n_paths, n_nodes, n_ants = self.counts
+    self.depth = self._section(n_synsets)
+    self.path_ptr = self._section(n_synsets + 1)
+    self.path_off = self._section(n_paths + 1)
+    self.nodes = self._section(n_nodes)
+    self.ant_ptr = self._section(n_synsets + 1)
+    self.ants = self._section(n_ants)
+
+  def synset(self, name: str) -> Synset:
+    return wordnet().synset(name)
+
+  def max_depth(self, synset_id: int) -> int:
+    return self.depth[synset_id]
+
+  def hypernym_paths(self, synset_id: int) -> List[Tuple[int, ...]]:
+    off, nodes = self.path_off, self.nodes
+    return [tuple(nodes[off[k]:off[k + 1]]) for k in range(self.path_ptr[synset_id], self.path_ptr[synset_id + 1])]
+
+  def antonyms(self, sense: str) -> Set[str]:
+    i = self.ids[sense]
+    return {self.names[j] for j in self.ants[self.ant_ptr[i]:self.ant_ptr[i + 1]]}
+
+
+class WordNetSnapshot(SynsetGraph):
+  """
+  A read-only, memory-mapped snapshot created by :func:`build_snapshot` that stores only the lemmas, antonym links, and hypernym edges.
+  Hypernym paths and max depths are derived from the edges on demand, so the file is smaller than the index and needs no NLTK.
+  """
+
+  def __init__(self, filename: str):
+    super().__init__(filename, SNAPSHOT_HEADER, SNAPSHOT_MAGIC, SNAPSHOT_VERSION)
+    n_synsets, n_lemmas, n_edges, n_links = self.counts
+    self.hyper_ptr = self._section(n_synsets + 1)
+    self.hypers = self._section(n_edges)
+    self.lemma_ptr = self._section(n_synsets + 1)
+    self.lemma_synset = self._section(n_lemmas)
+    self.link_ptr = self._section(n_lemmas + 1)
+    self.links = self._section(n_links)
+    self._paths = dict()
+
+  def synset(self, name: str) -> SnapshotSynset:
+    return SnapshotSynset(name)
+
+  def max_depth(self, synset_id: int) -> int:
+    return max(len(p) for p in self.hypernym_paths(synset_id)) - 1
+
+  def hypernym_paths(self, synset_id: int) -> List[Tuple[int, ...]]:
+    paths = self._paths.get(synset_id)
+    if paths is None:
+      hypers = self.hypers[self.hyper_ptr[synset_id]:self.hyper_ptr[synset_id + 1]]
+      paths = [p + (synset_id,) for h in hypers for p in self.hypernym_paths(h)] if len(hypers) else [(synset_id,)]
+      self._paths[synset_id] = paths
+    return paths
+
+  def antonyms(self, sense: str) -> Set[str]:
+    i = self.ids[sense]
+    lemmas = range(self.lemma_ptr[i], self.lemma_ptr[i + 1])
+    return {self.names[self.lemma_synset[a]] for l in lemmas for a in self.links[self.link_ptr[l]:self.link_ptr[l + 1]]}
+
+
+def _align(offset: int) -> int:
+  return (offset + 3) & ~3
+
+
+def _write_sections(filename: str, header: struct.Struct, magic: bytes, version: int, names: List[str], sections: List[array], counts: Iterable[int]):
+  names = '\n'.join(names).encode('utf-8')
+  header = header.pack(magic, version, *counts, len(names))
+
+  with open(filename, 'wb') as fout:
+    fout.write(header.ljust(_align(len(header)), b'\0'))
+    fout.write(names.ljust(_align(len(names)), b'\0'))
+    for a in sections:
+      fout.write(a.tobytes())
+
+
+def _tails(hypernym_paths: List[Tuple[int, ...]], lchs: List[int]) -> Dict[int, Dict[Tuple[int, ...], None]]:
+  """
+  :return: for each LCH, the distinct suffixes of the paths starting from that LCH, in the order they are first seen.
+  """
+  tails = {lch: dict() for lch in lchs}
+
+  for path in hypernym_paths:
+    for k, node in enumerate(path):
+      if node in tails:
+        tails[node].setdefault(path[k:], None)
+
+  return tails
+
+
+def _all_synsets() -> Tuple[list, Dict[str, int]]:
+  synsets = sorted(wordnet().all_synsets(), key=lambda s: s.name())
+  return synsets, {s.name(): i for i, s in enumerate(synsets)}
+
+
+def build_index(filename: str):
+  """
+  Walks all synsets in WordNet once and writes their hypernym paths, max depths, and antonyms to the index file.
+  :param filename: the path to the index file to be created; it can be loaded by :func:`load_index`.
+  """
+  synsets, ids = _all_synsets()
+  hypernyms = [[ids[h.name()] for h in s.hypernyms() + s.instance_hypernyms()] for s in synsets]
+  memo = dict()
+
+  def hypernym_paths(i: int) -> List[Tuple[int, ...]]:
+    if i not in memo:
+      memo[i] = [p + (i,) for h in hypernyms[i] for p in hypernym_paths(h)] if hypernyms[i] else [(i,)]
+    return memo[i]
+
+  depth, path_ptr, path_off, nodes, ant_ptr, ants = (array('i') for _ in range(6))
+  path_ptr.append(0)
+  path_off.append(0)
+  ant_ptr.append(0)
+
+  for i, synset in enumerate(synsets):
+    ps = hypernym_paths(i)
+    depth.append(max(len(p) for p in ps) - 1)
+    for p in ps:
+      nodes.extend(p)
+      path_off.append(len(nodes))
+    path_ptr.append(len(path_off) - 1)
+
+    ants.extend(sorted({ids[a.synset().name()] for lemma in synset.lemmas() for a in lemma.antonyms()}))
+    ant_ptr.append(len(ants))
+
+  counts = (len(synsets), len(path_off) - 1, len(nodes), len(ants))
+  _write_sections(filename, INDEX_HEADER, INDEX_MAGIC, INDEX_VERSION, list(ids), [depth, path_ptr, path_off, nodes, ant_ptr, ants], counts)
+
+
+def build_snapshot(filename: str):
+  """
+  Writes the lemmas, antonym links, and hypernym edges of all synsets in WordNet to the snapshot file.
+  :param filename: the path to the snapshot file to be created; it can be loaded by :func:`load_snapshot`.
+  """
+  synsets, ids = _all_synsets()
+  lemma_ids = {lemma.key(): j for j, lemma in enumerate(lemma for s in synsets for lemma in s.lemmas())}
+  hyper_ptr, hypers, lemma_ptr, lemma_synset, link_ptr, links = (array('i') for _ in range(6))
+  hyper_ptr.append(0)
+  lemma_ptr.append(0)
+  link_ptr.append(0)
+
+  for i, synset in enumerate(synsets):
+    hypers.extend(ids[h.name()] for h in synset.hypernyms() + synset.instance_hypernyms())
+    hyper_ptr.append(len(hypers))
+
+    for lemma in synset.lemmas():
+      lemma_synset.append(i)
+      links.extend(lemma_ids[a.key()] for a in lemma.antonyms())
+      link_ptr.append(len(links))
+    lemma_ptr.append(len(lemma_synset))
+
+  counts = (len(synsets), len(lemma_synset), len(hypers), len(links))
+  _write_sections(filename, SNAPSHOT_HEADER, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, list(ids), [hyper_ptr, hypers, lemma_ptr, lemma_synset, link_ptr, links], counts)
+
+
+def load_index(filename: str) -> HypernymIndex:
+  """
+  :param filename: the path to an index file created by :func:`build_index`.
+  :return: the memory-mapped index that can be passed to :func:`antonyms` and :func:`paths`.
+  """
+  return HypernymIndex(filename)
+
+
+def load_snapshot(filename: str) -> WordNetSnapshot:
+  """
+  :param filename: the path to a snapshot file created by :func:`build_snapshot`.
+  :return: the memory-mapped snapshot that can be passed to :func:`antonyms` and :func:`paths`.
+  """
+  return WordNetSnapshot(filename)
+
+
+# NumPy is imported by the functions below rather than at module import, which queries through antonyms() and paths() never pay for
+NO_ANCESTOR = 32767  # the largest int16
+
+
+def ancestor_table(index: SynsetGraph, senses: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  """
+  Encodes the ancestor set of every sense as rows of a sparse (CSR) array.
+  :param index: the hypernym index.
+  :param senses: a sequence of sense IDs (e.g., 'dog.n.01').
+  :return: a tuple of (pointers, ancestor IDs, distances), where the ancestors of senses[i], including itself,
+           are ancestors[pointers[i]:pointers[i+1]] and their distances are the fewest edges from senses[i].
+  """
+  import numpy as np
+  ptr, anc, dist = [0], [], []
+
+  for sense in senses:
+    d = dict()
+    for path in index.hypernym_paths(index.ids[sense]):
+      n = len(path) - 1
+      for k, node in enumerate(path):
+        d[node] = min(d.get(node, n - k), n - k)
+
+    anc.extend(d.keys())
+    dist.extend(d.values())
+    ptr.append(len(anc))
+
+  return np.array(ptr, dtype=np.int64), np.array(anc, dtype=np.int32), np.array(dist, dtype=np.int16)
+
+
+def _dense_block(table: Tuple[np.ndarray, np.ndarray, np.ndarray], lo: int, hi: int, columns: np.ndarray) -> np.ndarray:
+  """
+  :return: a (hi - lo, len(columns)) matrix of the distances from senses[lo:hi] to the ancestors in columns, NO_ANCESTOR if not an ancestor.
+  """
+  import numpy as np
+  ptr, anc, dist = table
+  rows = np.repeat(np.arange(hi - lo), np.diff(ptr[lo:hi + 1]))
+  anc, dist = anc[ptr[lo]:ptr[hi]], dist[ptr[lo]:ptr[hi]]
+  pos = np.searchsorted(columns, anc)
+  keep = pos < len(columns)
+  keep[keep] = columns[pos[keep]] == anc[keep]
+
+  block = np.full((hi - lo, len(columns)), NO_ANCESTOR, dtype=np.int16)
+  block[rows[keep], pos[keep]] = dist[keep]
+  return block
+
+
+def all_pairs(senses_0: Sequence[str], senses_1: Sequence[str], index: SynsetGraph, block_size: int = 256) -> Tuple[np.ndarray, np.ndarray]:
+  """
+  Finds the lowest common hypernyms of every pair in senses_0 x senses_1 in vectorized passes over blocks of pairs.
+  Within a block, only the ancestors shared by both sides become columns, which are few since they sit near the roots.
+  :param senses_0: a sequence of sense IDs for the rows.
+  :param senses_1: a sequence of sense IDs for the columns.
+  :param index: the hypernym index.
+  :param block_size: the number of senses on each side of a block; memory grows with its square.
+  :return: a tuple of (depths, lengths) matrices of shape (len(senses_0), len(senses_1)), where depths holds the max depth
+           of the lowest common hypernyms and lengths the number of edges in the shortest path returned by :func:`paths`;
+           both are -1 for pairs without a common hypernym.
+  """
+  import numpy as np
+  table_0 = ancestor_table(index, senses_0)
+  table_1 = ancestor_table(index, senses_1)
+  depths = np.full((len(senses_0), len(senses_1)), -1, dtype=np.int16)
+  lengths = np.full((len(senses_0), len(senses_1)), -1, dtype=np.int16)
+
+  for lo_0 in range(0, len(senses_0), block_size):
+    hi_0 = min(lo_0 + block_size, len(senses_0))
+    anc_0 = table_0[1][table_0[0][lo_0]:table_0[0][hi_0]]
+
+    for lo_1 in range(0, len(senses_1), block_size):
+      hi_1 = min(lo_1 + block_size, len(senses_1))
+      anc_1 = table_1[1][table_1[0][lo_1]:table_1[0][hi_1]]
+      columns = np.intersect1d(anc_0, anc_1)
+      if not len(columns): continue
+      depth = np.fromiter((index.max_depth(c) for c in columns), dtype=np.int32, count=len(columns))
+
+      dist_0 = _dense_block(table_0, lo_0, hi_0, columns)[:, None, :]
+      dist_1 = _dense_block(table_1, lo_1, hi_1, columns)[None, :, :]
+      common = (dist_0 != NO_ANCESTOR) & (dist_1 != NO_ANCESTOR)
+
+      lch_depth = np.where(common, depth, -1).max(axis=-1)
+      lch = common & (depth == lch_depth[..., None])
+      length = np.where(lch, dist_0.astype(np.int32) + dist_1, np.iinfo(np.int32).max).min(axis=-1)
+
+      depths[lo_0:hi_0, lo_1:hi_1] = lch_depth
+      lengths[lo_0:hi_0, lo_1:hi_1] = np.where(lch_depth >= 0, length, -1)
+
+  return depths, lengths
+
+
+def paths_for(pairs: Iterable[Tuple[str, str]], index: SynsetGraph) -> List[List[List[Synset]]]:
+  """
+  Builds the full paths only for the selected pairs, e.g., the pairs picked from the matrices returned by :func:`all_pairs`.
+  :param pairs: a collection of (sense_0, sense_1) pairs.
+  :param index: the hypernym index.
+  :return: the result of :func:`paths` for each pair.
+  """
+  return [paths(sense_0, sense_1, index) for sense_0, sense_1 in pairs]
+
+
+class LRUCache:
+  """
+  A size-bounded least-recently-used cache that counts its hits, misses, and evictions.
+  """
+
+  def __init__(self, maxsize: int = 4096):
+    """
+    :param maxsize: the maximum number of entries; 0 disables caching.
+    """
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._data = OrderedDict()
+
+  def __len__(self) -> int:
+    return len(self._data)
+
+  def get(self, key: Hashable) -> Optional[Any]:
+    value = self._data.get(key)
+
+    if value is None:
+      self.misses += 1
+    else:
+      self.hits += 1
+      self._data.move_to_end(key)
+
+    return value
+
+  def put(self, key: Hashable, value: Any):
+    if self.maxsize <= 0: return
+    self._data[key] = value
+    self._data.move_to_end(key)
+    self.resize(self.maxsize)
+
+  def resize(self, maxsize: int):
+    self.maxsize = maxsize
+    while len(self._data) > max(maxsize, 0):
+      self._data.popitem(last=False)
+      self.evictions += 1
+
+  def clear(self):
+    self._data.clear()
+    self.hits = self.misses = self.evictions = 0
+
+  def stats(self) -> Dict[str, float]:
+    lookups = self.hits + self.misses
+    return {
+      'size': len(self._data),
+      'maxsize': self.maxsize,
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'hit_rate': self.hits / lookups if lookups else 0.0,
+    }
+
+
+ANTONYMS_CACHE = LRUCache()
+PATHS_CACHE = LRUCache()
+
+
+def configure_cache(maxsize: int):
+  """
+  Resizes the result caches of :func:`antonyms` and :func:`paths`, evicting the least recently used entries if necessary.
+  :param maxsize: the maximum number of entries per cache; 0 disables caching.
+  """
+  ANTONYMS_CACHE.resize(maxsize)
+  PATHS_CACHE.resize(maxsize)
+
+
+def cache_stats() -> Dict[str, Dict[str, float]]:
+  """
+  :return: the size, hits, misses, evictions, and hit rate of each result cache.
+  """
+  return {'antonyms': ANTONYMS_CACHE.stats(), 'paths': PATHS_CACHE.stats()}
+
+
+def _cache_key(index: Optional[SynsetGraph]) -> int:
+  return 0 if index is None else index.cache_key
+
+
+def antonyms(sense: str, index: Optional[SynsetGraph] = None) -> Set[Synset]:
   """
   :param sense: the ID of the sense (e.g., 'dog.n.01').
-  :return: a set of Synsets representing the union of all antonyms of the sense as well as its synonyms.
+  :param index: if given, the answer is looked up from this index instead of walking the WordNet relations.
+  :return: a set of Synsets representing the union of all antonyms of the sense as well as its synonyms
+           (:class:`SnapshotSynset` with a :class:`WordNetSnapshot`).
+  """
+  # results from WordNet and from each index are cached apart, as their synset types may differ
+  key = (_cache_key(index), sense)
+  result = ANTONYMS_CACHE.get(key)
+
+  if result is None:
+    result = frozenset(_antonyms(sense, index))
+    ANTONYMS_CACHE.put(key, result)
+
+  return set(result)
+
+
+def paths(sense_0: str, sense_1: str, index: Optional[SynsetGraph] = None) -> List[List[Synset]]:
+  """
+  :param sense_0: the ID of the first sense (e.g., 'dog.n.01').
+  :param sense_1: the ID of the second sense (e.g., 'cat.n.01').
+  :param index: if given, the answer is looked up from this index instead of walking the WordNet relations.
+  :return: the paths from sense_0 to sense_1 through their lowest common hypernyms
+           (of :class:`SnapshotSynset` with a :class:`WordNetSnapshot`).
   """
+  # pairs are cached in one order; the other order is served by reversing each path
+  reverse = sense_1 < sense_0
+  pair = (sense_1, sense_0) if reverse else (sense_0, sense_1)
+  key = (_cache_key(index),) + pair
+  result = PATHS_CACHE.get(key)
+
+  if result is None:
+    result = tuple(map(tuple, _paths(*pair, index)))
+    PATHS_CACHE.put(key, result)
+
+  return [list(path[::-1] if reverse else path) for path in result]
+
+
+def _antonyms(sense: str, index: Optional[SynsetGraph] = None) -> Set[Synset]:
+  if index is not None:
+    return {index.synset(name) for name in index.antonyms(sense)}
+
   result = set()
 
-  synset = wn.synset(sense)
+  synset = wordnet().synset(sense)
 
   for lemma in synset.lemmas():
 
@@ -51,11 +600,14 @@ def antonyms(sense: str) -> Set[Synset]:
   return result
 
 
-def paths(sense_0: str, sense_1: str) -> List[List[Synset]]:
+def _paths(sense_0: str, sense_1: str, index: Optional[SynsetGraph] = None) -> List[List[Synset]]:
+    if index is not None:
+        return [[index.synset(name) for name in path] for path in index.paths(sense_0, sense_1)]
+
     result = list()
 
-    synset_0 = wn.synset(sense_0)
-    synset_1 = wn.synset(sense_1)
+    synset_0 = wordnet().synset(sense_0)
+    synset_1 = wordnet().synset(sense_1)
 
     hypernym_paths_0 = synset_0.hypernym_paths()
     hypernym_paths_1 = synset_1.hypernym_paths()
@@ -70,7 +622,7 @@ def paths(sense_0: str, sense_1: str) -> List[List[Synset]]:
       mapped_paths_1 = map(lambda path: path[path.index(lch):], filtered_paths_1)
 
       cleaned_paths_0 = map(list, set(map(tuple, mapped_paths_0)))
-      cleaned_paths_1 = map(list, set(map(tuple, mapped_paths_1)))
+      cleaned_paths_1 = list(map(list, set(map(tuple, mapped_paths_1))))
 
       for path_0 in cleaned_paths_0:
 
@@ -81,8 +633,55 @@ def paths(sense_0: str, sense_1: str) -> List[List[Synset]]:
     return result or list(list())
 
 
+def startup_times(snapshot: str, sense_0: str = 'dog.n.01', sense_1: str = 'cat.n.01') -> Dict[str, float]:
+  """
+  Measures the wall-clock time of short-lived workers, each in a fresh interpreter.
+  :param snapshot: the path to a snapshot file created by :func:`build_snapshot`.
+  :return: the seconds taken to start Python, to import this module, and to answer the first :func:`paths` query from WordNet and from the snapshot.
+  """
+  # the snapshot worker goes through the public API and fails if that loads NLTK
+  scripts = {
+    'python': 'pass',
+    'import': 'import quiz2',
+    'wordnet': 'import quiz2; quiz2.paths({!r}, {!r})'.format(sense_0, sense_1),
+    'snapshot': 'import sys, quiz2; quiz2.paths({1!r}, {2!r}, quiz2.load_snapshot({0!r})); assert "nltk" not in sys.modules'.format(os.path.abspath(snapshot), sense_0, sense_1),
+  }
+  times = dict()
+
+  for name, script in scripts.items():
+    start = time.time()
+    subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    times[name] = time.time() - start
+
+  return times
+
+
 if __name__ == '__main__':
-    print(antonyms('purchase.v.01'))
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--build-index', metavar='FILE', help='writes the hypernym index to FILE and exits')
+    parser.add_argument('--build-snapshot', metavar='FILE', help='writes the compact WordNet snapshot to FILE and exits')
+    parser.add_argument('--index', metavar='FILE', help='answers the demo queries from the hypernym index in FILE')
+    parser.add_argument('--snapshot', metavar='FILE', help='answers the demo queries from the snapshot in FILE')
+    parser.add_argument('--startup', metavar='FILE', help='compares the startup times with and without the snapshot in FILE and exits')
+    parser.add_argument('--cache-size', type=int, default=ANTONYMS_CACHE.maxsize, help='the maximum number of cached results per function; 0 disables caching')
+    args = parser.parse_args()
+
+    if args.build_index:
+        build_index(args.build_index)
+        parser.exit()
+
+    if args.build_snapshot:
+        build_snapshot(args.build_snapshot)
+        parser.exit()
+
+    if args.startup:
+        for name, seconds in startup_times(args.startup).items():
+            print('{:>8}: {:6.3f} sec'.format(name, seconds))
+        parser.exit()
+
+    configure_cache(args.cache_size)
+    index = load_index(args.index) if args.index else load_snapshot(args.snapshot) if args.snapshot else None
+    print(antonyms('purchase.v.01', index))
 
-    for path in paths('dog.n.01', 'cat.n.01'):
+    for path in paths('dog.n.01', 'cat.n.01', index):
         print([s.name() for s in path])
@@ -13,35 +13,74 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ========================================================================
+import argparse
+import asyncio
+import json
+import mmap
+import os
 import pickle
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from bisect import bisect_left
 from collections import Counter
-from typing import List, Tuple, Dict, Any
+from itertools import islice, product
+from multiprocessing import Pool
+from typing import List, Tuple, Dict, Any, Optional, Sequence, Iterable, Iterator, Callable
+
+import numpy as np
+
+from quiz1 import map_ordered
 
 DUMMY = '!@#$'
 
-def read_data(filename: str):
-    data, sentence = [], []
-    fin = open(filename)
+# feature tables in the order of the parameters returned by train(), followed by their weights
+FEATURES = ('cw', 'pp', 'pw', 'nw', 'pnw', 'cnw', 'pcw', 'pcnw', 'ic', 'au', 'al', 'if', 'il', 'hh')
+# number of words in the key of each dictionary table; the last six tables are distributions without keys
+ARITIES = (1, 1, 1, 1, 2, 2, 2, 3, 0, 0, 0, 0, 0, 0)
+
+MODEL_MAGIC = b'Q3CM'
+MODEL_VERSION = 2
+MODEL_HEADER = struct.Struct('<4s5I1s{}I{}d'.format(2 * len(FEATURES), len(FEATURES)))
+# array type codes of the stored probabilities: 64/32-bit floats, or 16/8-bit fixed points in [0, 1] with the given scales
+PRECISIONS = {'d': 1.0, 'f': 1.0, 'H': 1 / 0xFFFF, 'B': 1 / 0xFF}
+
+def iter_data(filename: str) -> Iterator[List[Tuple[str, str]]]:
+    """
+    Reads sentences lazily from a TSV file where each line has a word and its pos tag, and sentences are separated by blank lines.
+    """
+    sentence = []
+
+    with open(filename) as fin:
+        for line in fin:
+            l = line.split()
+            if l:
+                sentence.append((l[0], l[1]))
+            else:
+                yield sentence
+                sentence = []
+
+    if sentence:
+        yield sentence
 
-    for line in fin:
-        l = line.split()
-        if l:
-            sentence.append((l[0], l[1]))
-        else:
-            data.append(sentence)
-            sentence = []
 
-    return data
+def read_data(filename: str):
+    return list(iter_data(filename))
 
 
 def to_probs(model: Dict[Any, Counter]) -> Dict[str, List[Tuple[str, float]]]:
     probs = dict()
     for feature, counter in model.items():
-        ts = counter.most_common()
-        total = sum([count for _, count in ts])
-        probs[feature] = [(label, count/total) for label, count in ts]
+        probs[feature] = counter_to_probs(counter)
     return probs
 
+def counter_to_probs(counter: Counter) -> List[Tuple[str, float]]:
+    ts = counter.most_common()
+    total = sum([count for _, count in ts])
+    return [(label, count/total) for label, count in ts]
+
 def count_to_probs(model):
     total = sum(model.values())
     return {x: (count/total) for x, count in model.items()}
@@ -58,7 +97,10 @@ def evaluate(data: List[List[Tuple[str, str]]], *args):
     return accuracy
 
 
-def create_dictionaries(data):
+def count_dictionaries(data: Iterable[List[Tuple[str, str]]]) -> Tuple:
+    """
+    :return: the pos counts of the 14 feature tables in the order of FEATURES; create_dictionaries() turns them into probabilities.
+    """
     cw_dict = dict()    # key: curr word
     pp_dict = dict()    # key: prev pos
     pw_dict = dict()    # key: prev word
@@ -81,71 +123,363 @@ def create_dictionaries(data):
             prev_word = sentence[i-1][0] if i else DUMMY
             next_word = sentence[i+1][0] if i+1 < len(sentence) else DUMMY
 
-            cw_dict.setdefault(curr_word, Counter()).update([curr_pos])
-            pp_dict.setdefault(prev_pos, Counter()).update([curr_pos])
-            pw_dict.setdefault(prev_word, Counter()).update([curr_pos])
-            nw_dict.setdefault(next_word, Counter()).update([curr_pos])
-            pnw_dict.setdefault((prev_word, next_word), Counter()).update([curr_pos])
-            cnw_dict.setdefault((curr_word, next_word), Counter()).update([curr_pos])
-            pcw_dict.setdefault((prev_word, curr_word), Counter()).update([curr_pos])
-            pcnw_dict.setdefault((prev_word, curr_word, next_word), Counter()).update([curr_pos])
-
-            if curr_word[0] != curr_word[0].lower():        ic_count.update([curr_pos])
-            if curr_word == curr_word.upper():              au_count.update([curr_pos])
-            if curr_word == curr_word.lower():              al_count.update([curr_pos])
-            if curr_word == sentence[0][0]:                 if_count.update([curr_pos])
-            if curr_word == sentence[len(sentence)-1][0]:   il_count.update([curr_pos])
-            if '-' in curr_word:                            hh_count.update([curr_pos])
-
-    return (
-        to_probs(cw_dict),
-        to_probs(pp_dict),
-        to_probs(pw_dict),
-        to_probs(nw_dict),
-        to_probs(pnw_dict),
-        to_probs(cnw_dict),
-        to_probs(pcw_dict),
-        to_probs(pcnw_dict),
-        count_to_probs(ic_count),
-        count_to_probs(au_count),
-        count_to_probs(al_count),
-        count_to_probs(if_count),
-        count_to_probs(il_count),
-        count_to_probs(hh_count),
-    )
-
-
-def train(trn_data: List[List[Tuple[str, str]]], dev_data: List[List[Tuple[str, str]]]) -> Tuple:
+            _counter(cw_dict, curr_word)[curr_pos] += 1
+            _counter(pp_dict, prev_pos)[curr_pos] += 1
+            _counter(pw_dict, prev_word)[curr_pos] += 1
+            _counter(nw_dict, next_word)[curr_pos] += 1
+            _counter(pnw_dict, (prev_word, next_word))[curr_pos] += 1
+            _counter(cnw_dict, (curr_word, next_word))[curr_pos] += 1
+            _counter(pcw_dict, (prev_word, curr_word))[curr_pos] += 1
+            _counter(pcnw_dict, (prev_word, curr_word, next_word))[curr_pos] += 1
+
+            if curr_word[0] != curr_word[0].lower():        ic_count[curr_pos] += 1
+            if curr_word == curr_word.upper():              au_count[curr_pos] += 1
+            if curr_word == curr_word.lower():              al_count[curr_pos] += 1
+            if curr_word == sentence[0][0]:                 if_count[curr_pos] += 1
+            if curr_word == sentence[len(sentence)-1][0]:   il_count[curr_pos] += 1
+            if '-' in curr_word:                            hh_count[curr_pos] += 1
+
+    return cw_dict, pp_dict, pw_dict, nw_dict, pnw_dict, cnw_dict, pcw_dict, pcnw_dict, ic_count, au_count, al_count, if_count, il_count, hh_count
+
+
+def _counter(table: Dict[Any, Counter], key) -> Counter:
+    counter = table.get(key)
+    if counter is None:
+        counter = table[key] = Counter()
+    return counter
+
+
+def merge_counts(counts: Tuple, other: Tuple) -> Tuple:
+    """
+    Adds the counts of other to counts in place. Merging shards in their original order keeps the order in which
+    keys and tags were first seen, so ties in to_probs() are broken the same way as counting everything at once.
+    :return: counts
+    """
+    for table, other_table, arity in zip(counts, other, ARITIES):
+        if arity == 0:
+            table.update(other_table)
+        else:
+            for key, counter in other_table.items():
+                _counter(table, key).update(counter)
+    return counts
+
+
+def counts_to_dictionaries(counts: Tuple) -> Tuple:
+    return tuple(to_probs(table) if arity else count_to_probs(table) for table, arity in zip(counts, ARITIES))
+
+
+def create_dictionaries(data: Iterable[List[Tuple[str, str]]], processes: int = 1, shard_size: int = 1000) -> Tuple:
+    """
+    :param data: a collection of sentences, which can be a generator such as iter_data().
+    :param processes: the number of worker processes; with more than one, the sentences are split into shards that are counted in parallel and merged.
+    :param shard_size: the number of sentences per shard; at most two shards per worker are in memory at once.
+    :return: the 14 feature tables in the order of FEATURES.
+    """
+    if processes <= 1:
+        return counts_to_dictionaries(count_dictionaries(data))
+
+    return counts_to_dictionaries(count_parallel(data, processes, shard_size))
+
+
+def count_parallel(data: Iterable[List[Tuple[str, str]]], processes: Optional[int] = None, shard_size: int = 1000) -> Tuple:
+    """
+    Splits the sentences into shards, counts each shard in a worker process, and merges the counts in order.
+    """
+    data = iter(data)
+    shards = iter(lambda: list(islice(data, shard_size)), [])
+    counts = count_dictionaries([])
+
+    for shard_counts in map_ordered(_count_shard, shards, processes):
+        merge_counts(counts, shard_counts)
+
+    return counts
+
+
+def _count_shard(sentences: List[List[Tuple[str, str]]]) -> Tuple:
+    # plain dicts are several times faster to pass between processes than Counters
+    counts = count_dictionaries(sentences)
+    return tuple({key: dict(counter) for key, counter in table.items()} if arity else dict(table) for table, arity in zip(counts, ARITIES))
+
+
+class LazyProbs:
+    """
+    A dictionary table whose (pos, prob) lists are computed from the pos counts of each key when the key is first read,
+    and again after the counts of the key change. It supports the dict operations used by predict().
+    """
+
+    def __init__(self, counts: Dict[Any, Counter]):
+        self.counts = counts
+        self._probs = dict()
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __contains__(self, key) -> bool:
+        return key in self.counts
+
+    def __iter__(self) -> Iterator:
+        return iter(self.counts)
+
+    def get(self, key, default=None) -> Optional[List[Tuple[str, float]]]:
+        probs = self._probs.get(key)
+        if probs is None:
+            counter = self.counts.get(key)
+            if counter is None: return default
+            probs = self._probs[key] = counter_to_probs(counter)
+        return probs
+
+    def keys(self) -> Iterable:
+        return self.counts.keys()
+
+    def values(self) -> Iterator[List[Tuple[str, float]]]:
+        return (self.get(key) for key in self.counts)
+
+    def items(self) -> Iterator[Tuple[Any, List[Tuple[str, float]]]]:
+        return ((key, self.get(key)) for key in self.counts)
+
+    def invalidate(self, keys: Iterable):
+        for key in keys:
+            self._probs.pop(key, None)
+
+
+class LazyDistribution:
+    """
+    A pos distribution computed from its counts when first read, and again after the counts change.
+    """
+
+    def __init__(self, counts: Counter):
+        self.counts = counts
+        self._probs = None
+
+    def _distribution(self) -> Dict[str, float]:
+        if self._probs is None:
+            self._probs = count_to_probs(self.counts)
+        return self._probs
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __contains__(self, pos) -> bool:
+        return pos in self.counts
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._distribution())
+
+    def get(self, pos, default=None) -> Optional[float]:
+        return self._distribution().get(pos, default)
+
+    def keys(self) -> Iterable[str]:
+        return self._distribution().keys()
+
+    def items(self) -> Iterable[Tuple[str, float]]:
+        return self._distribution().items()
+
+    def invalidate(self, keys: Iterable = ()):
+        self._probs = None
+
+
+class TaggerModel:
+    """
+    A model that keeps the raw pos counts of its feature tables, so it can be updated with new sentences by update()
+    without recounting the whole corpus. Only the counts and weights are pickled.
+    """
+
+    def __init__(self, counts: Tuple, weights: Sequence[float] = None):
+        self.counts = counts
+        self.weights = tuple(weights or DEFAULT_WEIGHTS)
+        self.tables = tuple(LazyProbs(table) if arity else LazyDistribution(table) for table, arity in zip(counts, ARITIES))
+
+    @property
+    def args(self) -> Tuple:
+        """
+        :return: the parameters in the same form as returned by train(), to be passed to predict() or evaluate().
+        """
+        return self.tables + self.weights
+
+    def __getstate__(self):
+        return self.counts, self.weights
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+def create_model(data: Iterable[List[Tuple[str, str]]], weights: Sequence[float] = None, processes: int = 1) -> TaggerModel:
+    """
+    :param data: a collection of sentences.
+    :param weights: the weights of the 14 features (default: DEFAULT_WEIGHTS), e.g., found by search_weights().
+    :param processes: the number of worker processes used for counting.
+    """
+    counts = count_dictionaries(data) if processes <= 1 else count_parallel(data, processes)
+    return TaggerModel(counts, weights)
+
+
+def update(model: TaggerModel, new_sentences: Iterable[List[Tuple[str, str]]]) -> TaggerModel:
+    """
+    Adds the counts of the new sentences to the model in place. Only the keys seen in the new sentences are invalidated,
+    and their probabilities are recomputed when they are next read, so the cost is proportional to the new sentences.
+    :return: the model.
+    """
+    batch = count_dictionaries(new_sentences)
+    merge_counts(model.counts, batch)
+
+    for table, batch_table in zip(model.tables, batch):
+        table.invalidate(batch_table.keys())
+
+    return model
+
+
+def save_model(model: TaggerModel, filename: str):
+    with open(filename, 'wb') as fout:
+        pickle.dump(model, fout, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_model(filename: str) -> TaggerModel:
+    with open(filename, 'rb') as fin:
+        return pickle.load(fin)
+
+
+# manually entered weights after approximation through sub-grid searches of max O(n^5); the starting point of search_weights()
+DEFAULT_WEIGHTS = (1.0, 0.5, 0.5, 0.5, 0.5, 1.0, 1.0, 1.0, 0.1, 1.0, 0.1, 0.1, 0.1, 1.0)
+
+
+class ContributionCache:
+    """
+    The unweighted contribution of every feature to every (token, tag) score of a dataset, computed once so that
+    a weight vector is scored with matrix products instead of re-tagging the whole dataset.
+    The prev pos feature uses the gold previous tag instead of the predicted one, so accuracy() approximates evaluate().
+    """
+
+    def __init__(self, data: List[List[Tuple[str, str]]], tables: Tuple):
+        self.tags = sorted({tag for table, arity in zip(tables, ARITIES) for tag in _table_tags(table, arity)})
+        tag_ids = {tag: i for i, tag in enumerate(self.tags)}
+        n_tags = len(self.tags)
+
+        cells, features, values, gold, shapes = [], [], [], [], []
+        row = 0
+
+        for sentence in data:
+            for i, (curr_word, curr_pos) in enumerate(sentence):
+                prev_pos = sentence[i-1][1] if i > 0 else DUMMY
+                prev_word = sentence[i-1][0] if i > 0 else DUMMY
+                next_word = sentence[i+1][0] if i+1 < len(sentence) else DUMMY
+                keys = (curr_word, prev_pos, prev_word, next_word, (prev_word, next_word), (curr_word, next_word), (prev_word, curr_word), (prev_word, curr_word, next_word))
+
+                for f, key in enumerate(keys):
+                    for pos, prob in tables[f].get(key, list()):
+                        cells.append(row * n_tags + tag_ids[pos])
+                        features.append(f)
+                        values.append(prob)
+
+                gold.append(tag_ids.get(curr_pos, -1))
+                shapes.append((curr_word[0] == curr_word[0].upper(), curr_word == curr_word.upper(), curr_word == curr_word.lower(), i == 0, i == len(sentence)-1, '-' in curr_word))
+                row += 1
+
+        # dictionary features: one row per touched (token, tag) cell and one column per feature
+        self.cells, inverse = np.unique(np.array(cells, dtype=np.int64), return_inverse=True)
+        self.dict_contributions = np.zeros((len(self.cells), 8))
+        self.dict_contributions[inverse, features] = values
+
+        # distribution features: a (token x feature) mask times a (feature x tag) matrix
+        self.masks = np.array(shapes, dtype=np.float64).reshape(-1, 6)
+        self.distributions = np.zeros((6, n_tags))
+        for f, table in enumerate(tables[8:]):
+            for pos, prob in table.items():
+                self.distributions[f, tag_ids[pos]] = prob
+
+        # tags that predict() never scores for a token must not win
+        touched = (self.masks @ (self.distributions > 0)) > 0
+        touched.flat[self.cells] = True
+        self.offsets = np.where(touched, 0.0, -np.inf)
+        self.gold = np.array(gold, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.gold)
+
+    def accuracy(self, weights: Sequence[float]) -> float:
+        """
+        :param weights: the weights of the 14 features, in the order of FEATURES.
+        :return: the approximate accuracy of the weights on the cached dataset.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        scores = (self.masks * weights[8:]) @ self.distributions + self.offsets
+        scores.flat[self.cells] += self.dict_contributions @ weights[:8]
+        predicted = scores.argmax(axis=1)
+        # a token with no scored tag is tagged 'XX' by predict(), given here as a column that matches no gold tag
+        predicted[np.isneginf(scores[np.arange(len(predicted)), predicted])] = len(self.tags)
+        return 100.0 * float(np.count_nonzero(predicted == self.gold)) / len(self.gold)
+
+
+def _table_tags(table, arity: int):
+    return table.keys() if arity == 0 else (pos for entries in table.values() for pos, _ in entries)
+
+
+_cache: Optional[ContributionCache] = None
+
+
+def _init_search(cache: ContributionCache):
+    global _cache
+    _cache = cache
+
+
+def _accuracy(weights: Tuple[float, ...]) -> float:
+    return _cache.accuracy(weights)
+
+
+def _best_of(candidates: List[Tuple[float, ...]]) -> Tuple[float, Tuple[float, ...]]:
+    return max(((_cache.accuracy(weights), weights) for weights in candidates), key=lambda t: t[0])
+
+
+def search_weights(cache: ContributionCache, grid: Sequence[float] = (0.1, 0.5, 1.0), method: str = 'coordinate', processes: Optional[int] = None, start: Sequence[float] = DEFAULT_WEIGHTS, chunk_size: int = 1000) -> Tuple[float, Tuple[float, ...]]:
+    """
+    Searches the weights of the 14 features on the grid, scoring each weight vector with the contribution cache.
+    :param cache: the contributions of the features on the development set.
+    :param grid: the candidate values of each weight.
+    :param method: 'coordinate' for steepest coordinate ascent from start, which scores every single weight change per sweep
+                   and takes the best until none helps, or 'grid' for all len(grid)**14 combinations.
+    :param processes: the number of worker processes (default: #cpus); the cache is passed to each worker once.
+    :param start: the initial weights for coordinate ascent.
+    :param chunk_size: the number of combinations scored per task in the grid search.
+    :return: the best approximate accuracy and its weights.
+    """
+    with Pool(processes, initializer=_init_search, initargs=(cache,)) as pool:
+        if method == 'grid':
+            combinations = product(grid, repeat=len(FEATURES))
+            chunks = iter(lambda: list(islice(combinations, chunk_size)), [])
+            return max(pool.imap_unordered(_best_of, chunks), key=lambda t: t[0])
+
+        best = tuple(start)
+        best_acc = cache.accuracy(best)
+
+        while True:
+            # all 14 x (len(grid) - 1) moves of a sweep go to the pool at once, so every worker stays busy
+            candidates = [best[:f] + (value,) + best[f+1:] for f in range(len(FEATURES)) for value in grid if value != best[f]]
+            if not candidates: break
+            acc, weights = max(zip(pool.map(_accuracy, candidates), candidates), key=lambda t: t[0])
+            if acc <= best_acc: break
+            best_acc, best = acc, weights
+            print('{:5.2f}% - {}'.format(best_acc, ', '.join('{}: {:3.1f}'.format(n, w) for n, w in zip(FEATURES, best))))
+
+        return best_acc, best
+
+
+def train(trn_data: List[List[Tuple[str, str]]], dev_data: List[List[Tuple[str, str]]], method: str = 'coordinate', processes: Optional[int] = None) -> Tuple:
     """
     :param trn_data: the training set
     :param dev_data: the development set
+    :param method: the search method of search_weights()
+    :param processes: the number of worker processes used by search_weights()
     :return: a tuple of all parameters necessary to perform part-of-speech tagging
     """
+    tables = create_dictionaries(trn_data)
+    _, weights = search_weights(ContributionCache(dev_data, tables), method=method, processes=processes)
 
-    cw_dict, pp_dict, pw_dict, nw_dict, pnw_dict, cnw_dict, pcw_dict, pcnw_dict, ic_count, au_count, al_count, if_count, il_count, hh_count = create_dictionaries(trn_data)
+    # the cache approximates the previous pos, so the found weights are confirmed against the hand-tuned ones
     best_acc, best_args = -1, None
-    grid = [0.1, 0.5, 1.0]
-
-    # manually entered weights after approximation through sub-grid searches of max O(n^5)
-
-    for cw_weight in [1.0]:
-        for pp_weight in [0.5]:
-            for pw_weight in [0.5]:
-                for nw_weight in [0.5]:
-                    for pnw_weight in [0.5]:
-                        for cnw_weight in [1.0]:
-                            for pcw_weight in [1.0]:
-                                for pcnw_weight in [1.0]:
-                                    for ic_weight in [0.1]:
-                                        for au_weight in [1.0]:
-                                            for al_weight in [0.1]:
-                                                for if_weight in [0.1]:
-                                                    for il_weight in [0.1]:
-                                                        for hh_weight in [1.0]:
-                                                            args = (cw_dict, pp_dict, pw_dict, nw_dict, pnw_dict, cnw_dict, pcw_dict, pcnw_dict, ic_count, au_count, al_count, if_count, il_count, hh_count, cw_weight, pp_weight, pw_weight, nw_weight, pnw_weight, cnw_weight, pcw_weight, pcnw_weight, ic_weight, au_weight, al_weight, if_weight, il_weight, hh_weight)
-                                                            acc = evaluate(dev_data, *args)
-                                                            print('{:5.2f}% - cw: {:3.1f}, pp: {:3.1f}, pw: {:3.1f}, nw: {:3.1f}, pnw: {:3.1f}, cnw: {:3.1f}, pcw: {:3.1f}, pcnw: {:3.1f}, ic: {:3.1f}, au: {:3.1f}, al: {:3.1f}, if: {:3.1f}, il: {:3.1f}, hh: {:3.1f}'.format(acc, cw_weight, pp_weight, pw_weight, nw_weight, pnw_weight, cnw_weight, pcw_weight, pcnw_weight, ic_weight, au_weight, al_weight, if_weight, il_weight, hh_weight))
-                                                            if acc > best_acc: best_acc, best_args = acc, args
+    for candidate in (weights, DEFAULT_WEIGHTS):
+        args = tables + tuple(candidate)
+        acc = evaluate(dev_data, *args)
+        print('{:5.2f}% - {}'.format(acc, ', '.join('{}: {:3.1f}'.format(n, w) for n, w in zip(FEATURES, candidate))))
+        if acc > best_acc: best_acc, best_args = acc, args
 
     return best_args
 
@@ -215,16 +549,743 @@ def predict(tokens: List[str], *args) -> List[Tuple[str, float]]:
     return output
 
 
+_predict = predict  # the uninstrumented predict(), restored by disable_profiling()
+
+
+class CompactTable:
+    """
+    A read-only view of a dictionary table in a compact model, supporting the dict operations used by predict().
+    Keys are encoded as integers from the IDs of their words and kept sorted so they can be found by binary search;
+    the (tag, prob) entries of the i'th key are the ones in [ptr[i], ptr[i+1]), in the same order as the original list.
+    """
+
+    def __init__(self, model: 'CompactModel', arity: int, codes: Sequence[int], ptr: Sequence[int], tags: Sequence[int], probs: Sequence[float]):
+        self.model = model
+        self.arity = arity
+        self.codes = codes
+        self.ptr = ptr
+        self.tags = tags
+        self.probs = probs
+        self.scale = PRECISIONS[model.precision]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __contains__(self, key) -> bool:
+        return self.find(key) >= 0
+
+    def find(self, key) -> int:
+        """
+        :return: the index of the key in this table, or -1 if it is not found.
+        """
+        code = self.model.encode(_key_words(key, self.arity))
+        if code < 0: return -1
+        i = bisect_left(self.codes, code)
+        return i if i < len(self.codes) and self.codes[i] == code else -1
+
+    def get(self, key, default=None) -> Optional[List[Tuple[str, float]]]:
+        i = self.find(key)
+        if i < 0: return default
+        tags, probs, scale = self.model.tags, self.probs, self.scale
+        return [(tags[self.tags[j]], probs[j] * scale) for j in range(self.ptr[i], self.ptr[i + 1])]
+
+
+class CompactModel:
+    """
+    A model loaded from a file created by save_compact(). Words and tags are interned to integer IDs and the feature tables
+    are flat arrays memory-mapped from the file, so processes loading the same file share its pages.
+    """
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as fin:
+            self._mm = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+
+        fields = MODEL_HEADER.unpack_from(self._mm)
+        magic, version, n_tags, n_words, tags_len, words_len, precision = fields[:7]
+        if magic != MODEL_MAGIC or version != MODEL_VERSION:
+            raise ValueError('{} is not a compact model (version {})'.format(filename, MODEL_VERSION))
+
+        self.precision = precision.decode('ascii')
+        sizes = fields[7:7 + 2 * len(FEATURES)]
+        self.weights = fields[7 + 2 * len(FEATURES):]
+        view = memoryview(self._mm)
+        offset = _align(MODEL_HEADER.size)
+
+        self.tags = self._mm[offset:offset + tags_len].decode('utf-8').split('\n')
+        offset = _align(offset + tags_len)
+        self.words = self._mm[offset:offset + words_len].decode('utf-8').split('\n')
+        self.word_ids = {word: i for i, word in enumerate(self.words)}
+        offset = _align(offset + words_len)
+
+        self.tables = []
+        for arity, n_keys, n_entries in zip(ARITIES, sizes[0::2], sizes[1::2]):
+            sections = []
+            for fmt, size in (('q', n_keys), ('i', n_keys + 1), ('h', n_entries), (self.precision, n_entries)):
+                end = offset + struct.calcsize(fmt) * size
+                sections.append(view[offset:end].cast(fmt))
+                offset = _align(end)
+
+            table = CompactTable(self, arity, *sections)
+            if arity == 0:
+                # distributions over tags without keys are small enough to be plain dicts, as returned by count_to_probs()
+                table = dict(table.get(None) or [])
+            self.tables.append(table)
+
+    @property
+    def args(self) -> Tuple:
+        """
+        :return: the parameters in the same form as returned by train(), to be passed to predict() or evaluate().
+        """
+        return tuple(self.tables) + tuple(self.weights)
+
+    def encode(self, words: Tuple[str, ...]) -> int:
+        """
+        :return: the integer code of the key consisting of the words, or -1 if any word is out of the vocabulary.
+        """
+        code, size = 0, len(self.words)
+        for word in words:
+            i = self.word_ids.get(word, -1)
+            if i < 0: return -1
+            code = code * size + i
+        return code
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _key_words(key, arity: int) -> Tuple[str, ...]:
+    return key if arity > 1 else (key,) if arity == 1 else ()
+
+
+def save_compact(args: Tuple, filename: str, precision: str = 'd'):
+    """
+    Saves the parameters returned by train() in the compact model format, which can be loaded by load_compact().
+    :param args: the feature tables followed by their weights.
+    :param filename: the path to the model file.
+    :param precision: the array type code of the stored probabilities in PRECISIONS; 'd' keeps them exact, the others trade accuracy for size.
+    """
+    scale = PRECISIONS[precision]
+    tables, weights = args[:len(FEATURES)], args[len(FEATURES):]
+    tags, words = dict(), dict()
+
+    for table, arity in zip(tables, ARITIES):
+        if arity == 0:
+            for tag in table: tags.setdefault(tag, len(tags))
+            continue
+
+        for key, entries in table.items():
+            for word in _key_words(key, arity): words.setdefault(word, len(words))
+            for tag, _ in entries: tags.setdefault(tag, len(tags))
+
+    size = len(words)
+    if size ** 3 >= 2 ** 63: raise ValueError('too many words to encode the keys: {}'.format(size))
+    sizes, sections = [], []
+
+    for table, arity in zip(tables, ARITIES):
+        if arity == 0:
+            items = [(0, list(table.items()))]
+        else:
+            items = []
+            for key, entries in table.items():
+                code = 0
+                for word in _key_words(key, arity): code = code * size + words[word]
+                items.append((code, entries))
+            items.sort(key=lambda t: t[0])
+
+        codes, ptr, tag_ids, probs = array('q'), array('i', [0]), array('h'), array(precision)
+        for code, entries in items:
+            codes.append(code)
+            tag_ids.extend(tags[tag] for tag, _ in entries)
+            probs.extend(prob if scale == 1.0 else round(prob / scale) for _, prob in entries)
+            ptr.append(len(tag_ids))
+
+        sizes.extend((len(codes), len(tag_ids)))
+        sections.extend((codes, ptr, tag_ids, probs))
+
+    tag_blob = '\n'.join(tags).encode('utf-8')
+    word_blob = '\n'.join(words).encode('utf-8')
+    header = MODEL_HEADER.pack(MODEL_MAGIC, MODEL_VERSION, len(tags), size, len(tag_blob), len(word_blob), precision.encode('ascii'), *sizes, *weights)
+
+    with open(filename, 'wb') as fout:
+        for b in [header, tag_blob, word_blob] + [a.tobytes() for a in sections]:
+            fout.write(b.ljust(_align(len(b)), b'\0'))
+
+
+def load_compact(filename: str) -> CompactModel:
+    """
+    :param filename: the path to a model file created by save_compact().
+    :return: the memory-mapped model; its args can be passed to predict() or evaluate().
+    """
+    return CompactModel(filename)
+
+
+def convert_model(pkl_filename: str, filename: str):
+    """
+    Converts a model pickled from the parameters returned by train() (e.g., quiz3.pkl) into the compact model format.
+    """
+    with open(pkl_filename, 'rb') as fin:
+        args = pickle.load(fin)
+    save_compact(args, filename)
+
+
+def prune(model: TaggerModel, min_count: int = 2, top_k: Optional[int] = None, features: Sequence[str] = ('pnw', 'cnw', 'pcw', 'pcnw')) -> TaggerModel:
+    """
+    :param model: the model to be pruned, which is not modified.
+    :param min_count: the minimum number of times a key must have been seen to be kept.
+    :param top_k: if given, only the top-k most frequent tags of each key are kept, and their probabilities are renormalized.
+    :param features: the names of the dictionary tables to be pruned; the trigram and bigram tables hold most of the keys.
+    :return: a new model with its own copies of all counts, so that updating either model does not affect the other.
+    """
+    counts = []
+
+    for f, (feature, table) in enumerate(zip(FEATURES, model.counts)):
+        if not ARITIES[f]:
+            counts.append(Counter(table))
+        elif feature not in features:
+            counts.append({key: Counter(counter) for key, counter in table.items()})
+        else:
+            counts.append({key: Counter(dict(counter.most_common(top_k))) if top_k else Counter(counter)
+                           for key, counter in table.items() if sum(counter.values()) >= min_count})
+
+    return TaggerModel(tuple(counts), model.weights)
+
+
+def prune_report(model: TaggerModel, dev_data: List[List[Tuple[str, str]]], min_counts: Sequence[int] = (1, 2, 5), top_ks: Sequence[Optional[int]] = (None, 2), precisions: Sequence[str] = ('d', 'f', 'H', 'B'), dirname: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Saves the model as a compact model at each setting of pruning and precision, and measures its file size, load time, and dev accuracy.
+    :param model: the unpruned model.
+    :param dev_data: the development set for evaluate().
+    :param dirname: the directory to save the models in (default: a temporary directory deleted afterwards).
+    :return: one dict per setting with min_count, top_k, precision, keys (kept in the pruned tables), bytes, load_time, and accuracy.
+    """
+    report = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for min_count in min_counts:
+            for top_k in top_ks:
+                pruned = prune(model, min_count, top_k)
+                keys = sum(len(pruned.counts[FEATURES.index(f)]) for f in ('pnw', 'cnw', 'pcw', 'pcnw'))
+
+                for precision in precisions:
+                    filename = os.path.join(dirname or tmpdir, 'quiz3-{}-{}-{}.bin'.format(min_count, top_k or 'all', precision))
+                    save_compact(pruned.args, filename, precision)
+                    start = time.time()
+                    compact = load_compact(filename)
+                    load_time = time.time() - start
+
+                    row = {
+                        'min_count': min_count,
+                        'top_k': top_k,
+                        'precision': precision,
+                        'keys': keys,
+                        'bytes': os.path.getsize(filename),
+                        'load_time': load_time,
+                        'accuracy': evaluate(dev_data, *compact.args),
+                    }
+                    print('min_count: {min_count}, top_k: {top_k}, precision: {precision}, keys: {keys:,}, bytes: {bytes:,}, load: {load_time:.4f}s, acc: {accuracy:5.2f}%'.format(**row))
+                    report.append(row)
+
+    return report
+
+
+def load_args(filename: str) -> Tuple:
+    """
+    :param filename: a compact model from save_compact(), a TaggerModel from save_model(), or pickled train() parameters (e.g., quiz3.pkl).
+    :return: the parameters to be passed to predict() or evaluate().
+    """
+    with open(filename, 'rb') as fin:
+        if fin.read(len(MODEL_MAGIC)) == MODEL_MAGIC:
+            return load_compact(filename).args
+        fin.seek(0)
+        model = pickle.load(fin)
+
+    return model.args if isinstance(model, TaggerModel) else model
+
+
+_args: Optional[Tuple] = None
+
+
+def _init_evaluate(args: Optional[Tuple], model_path: Optional[str]):
+    global _args
+    _args = load_args(model_path) if model_path else args
+
+
+def _evaluate_counts(data: List[List[Tuple[str, str]]]) -> Tuple[Counter, Counter]:
+    total, correct = Counter(), Counter()
+    for sentence in data:
+        tokens, gold = tuple(zip(*sentence))
+        pred = [t[0] for t in predict(tokens, *_args)]
+        total.update(gold)
+        correct.update(g for g, p in zip(gold, pred) if g == p)
+    return total, correct
+
+
+def evaluate_parallel(data: List[List[Tuple[str, str]]], args: Optional[Tuple] = None, model_path: Optional[str] = None, processes: Optional[int] = None, chunk_size: int = 200) -> Dict[str, Any]:
+    """
+    Evaluates the sentences split into chunks across a process pool, where each worker holds one read-only model.
+    :param data: the sentences with gold tags.
+    :param args: the parameters of the model, passed to the workers once; with the fork start method, the workers share them copy-on-write.
+    :param model_path: alternatively, a model file loaded by load_args() once per worker; compact models are memory-mapped, so the workers share their pages.
+    :param processes: the number of worker processes (default: #cpus).
+    :param chunk_size: the number of sentences per task.
+    :return: a dict with accuracy, correct, total, per_tag (tag -> (correct, total, accuracy)), seconds, and tokens_per_sec.
+    """
+    if (args is None) == (model_path is None):
+        raise ValueError('either args or model_path must be given')
+
+    start = time.time()
+    total, correct = Counter(), Counter()
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    with Pool(processes, initializer=_init_evaluate, initargs=(args, model_path)) as pool:
+        for chunk_total, chunk_correct in pool.imap_unordered(_evaluate_counts, chunks):
+            total.update(chunk_total)
+            correct.update(chunk_correct)
+
+    seconds = time.time() - start
+    n, c = sum(total.values()), sum(correct.values())
+    return {
+        'accuracy': 100.0 * c / n if n else 0.0,
+        'correct': c,
+        'total': n,
+        'per_tag': {tag: (correct[tag], count, 100.0 * correct[tag] / count) for tag, count in total.most_common()},
+        'seconds': seconds,
+        'tokens_per_sec': n / seconds if seconds else 0.0,
+    }
+
+
+class FeatureProfile:
+    """
+    Per-feature statistics collected while profiling is enabled: the number of lookups, the number of hits (keys found,
+    or shape conditions that hold), the seconds spent on each lookup and its score updates, and the number of tokens
+    whose predicted tag would differ without the feature.
+    """
+
+    def __init__(self):
+        self.tokens = 0
+        self.lookups = [0] * len(FEATURES)
+        self.hits = [0] * len(FEATURES)
+        self.seconds = [0.0] * len(FEATURES)
+        self.changes = [0] * len(FEATURES)
+
+    def report(self) -> List[Dict[str, Any]]:
+        return [{
+            'feature': feature,
+            'lookups': self.lookups[f],
+            'hits': self.hits[f],
+            'hit_rate': self.hits[f] / self.lookups[f] if self.lookups[f] else 0.0,
+            'seconds': self.seconds[f],
+            'argmax_changes': self.changes[f],
+            'change_rate': self.changes[f] / self.tokens if self.tokens else 0.0,
+        } for f, feature in enumerate(FEATURES)]
+
+    def save(self, filename: str):
+        with open(filename, 'w') as fout:
+            json.dump({'tokens': self.tokens, 'features': self.report()}, fout, indent=2)
+
+    def print(self):
+        print('{:>6} {:>10} {:>8} {:>10} {:>8}'.format('feature', 'lookups', 'hit', 'seconds', 'change'))
+        for row in self.report():
+            print('{feature:>6} {lookups:>10,} {hit_rate:>8.2%} {seconds:>10.4f} {change_rate:>8.2%}'.format(**row))
+
+
+PROFILE: Optional[FeatureProfile] = None
+
+
+def enable_profiling() -> FeatureProfile:
+    """
+    Replaces predict() with an instrumented version that records a FeatureProfile; evaluate() and the other callers
+    look predict() up at call time, so nothing is instrumented or checked while profiling is disabled.
+    :return: the new profile.
+    """
+    global predict, PROFILE
+    PROFILE = FeatureProfile()
+    predict = _profiled_predict
+    return PROFILE
+
+
+def disable_profiling() -> Optional[FeatureProfile]:
+    """
+    Restores the uninstrumented predict().
+    :return: the profile collected since enable_profiling().
+    """
+    global predict
+    predict = _predict
+    return PROFILE
+
+
+def _profiled_predict(tokens: List[str], *args) -> List[Tuple[str, float]]:
+    # the same scores as predict(), added in the same order, while timing each feature and keeping its contributions
+    tables, weights = args[:len(FEATURES)], args[len(FEATURES):]
+    profile, clock = PROFILE, time.perf_counter
+    output = []
+
+    for i in range(len(tokens)):
+        scores, contributions = dict(), []
+        curr_word = tokens[i]
+        prev_pos = output[i-1][0] if i > 0 else DUMMY
+        prev_word = tokens[i-1] if i > 0 else DUMMY
+        next_word = tokens[i+1] if i+1 < len(tokens) else DUMMY
+        keys = (curr_word, prev_pos, prev_word, next_word, (prev_word, next_word), (curr_word, next_word), (prev_word, curr_word), (prev_word, curr_word, next_word))
+        shapes = (curr_word[0] == curr_word[0].upper(), curr_word == curr_word.upper(), curr_word == curr_word.lower(), i == 0, i == len(tokens)-1, '-' in curr_word)
+
+        for f, (table, weight) in enumerate(zip(tables, weights)):
+            start = clock()
+            if f < len(keys):
+                entries = table.get(keys[f], list())
+            else:
+                entries = table.items() if shapes[f - len(keys)] else ()
+
+            contribution = dict()
+            for pos, prob in entries:
+                scores[pos] = scores.get(pos, 0) + prob * weight
+                contribution[pos] = prob * weight
+
+            profile.seconds[f] += clock() - start
+            profile.lookups[f] += 1
+            if contribution: profile.hits[f] += 1
+            contributions.append(contribution)
+
+        o = max(scores.items(), key=lambda t: t[1]) if scores else ('XX', 0.0)
+        output.append(o)
+        profile.tokens += 1
+
+        for f, contribution in enumerate(contributions):
+            if not contribution: continue
+            others = {pos for g, c in enumerate(contributions) if g != f for pos in c}
+            without = [(pos, score - contribution.get(pos, 0)) for pos, score in scores.items() if pos in others]
+            if (max(without, key=lambda t: t[1])[0] if without else 'XX') != o[0]:
+                profile.changes[f] += 1
+
+    return output
+
+
+def _gather(table: CompactTable, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :param keys: the index of a key in the table for each row, or -1 for no key.
+    :return: (rows, tag IDs, probs, positions in the lists) of all (tag, prob) entries of the keys.
+    """
+    ptr, tags, probs = (np.asarray(a) for a in (table.ptr, table.tags, table.probs))
+    rows = np.nonzero(keys >= 0)[0]
+    starts = ptr[keys[rows]]
+    lens = ptr[keys[rows] + 1] - starts
+    positions = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+    idx = np.repeat(starts, lens) + positions
+    return np.repeat(rows, lens), tags[idx].astype(np.int64), probs[idx] * table.scale, positions
+
+
+def _find_all(table: CompactTable, codes: np.ndarray) -> np.ndarray:
+    """
+    :param codes: the key codes to find, where negative codes are out of the vocabulary.
+    :return: the index of each code in the table, or -1 if not found.
+    """
+    table_codes = np.asarray(table.codes)
+    if not len(table_codes): return np.full(len(codes), -1)
+    idx = np.minimum(np.searchsorted(table_codes, codes), len(table_codes) - 1)
+    return np.where((codes >= 0) & (table_codes[idx] == codes), idx, -1)
+
+
+def predict_batch(sentences: Sequence[Sequence[str]], model: CompactModel, batch_size: int = 4096) -> List[List[Tuple[str, float]]]:
+    """
+    Tags many sentences at once with the same greedy left-to-right decoding as predict(), giving exactly the same output.
+    Tags are integer columns of a score matrix with one row per sentence; the weighted contributions of each feature are added
+    as arrays in the same order as predict(), and ties are broken by the order in which the tags were first scored.
+    :param sentences: a sequence of token lists.
+    :param model: the compact model.
+    :param batch_size: the maximum number of sentences decoded together.
+    :return: the output of predict() for each sentence.
+    """
+    output = []
+    for i in range(0, len(sentences), batch_size):
+        output.extend(_predict_batch(sentences[i:i + batch_size], model))
+    return output
+
+
+def _predict_batch(sentences: Sequence[Sequence[str]], model: CompactModel) -> List[List[Tuple[str, float]]]:
+    tables, weights = model.tables, model.weights
+    size, n_tags = len(model.words), len(model.tags)
+    tag_names = model.tags + ['XX']  # the last column is the tag given when nothing is scored
+
+    lengths = np.array([len(tokens) for tokens in sentences], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    tokens = [token for sentence in sentences for token in sentence]
+    dummy = model.word_ids.get(DUMMY, -1)
+
+    # word IDs of the current, previous, and next tokens
+    curr = np.array([model.word_ids.get(token, -1) for token in tokens], dtype=np.int64)
+    first = np.zeros(len(tokens), dtype=bool)
+    first[offsets[:-1][lengths > 0]] = True
+    last = np.zeros(len(tokens), dtype=bool)
+    last[offsets[1:][lengths > 0] - 1] = True
+    prev = np.where(first, dummy, np.roll(curr, 1))
+    succ = np.where(last, dummy, np.roll(curr, -1))
+
+    def code(*ids):
+        c = np.zeros(len(tokens), dtype=np.int64)
+        for i in ids: c = c * size + i
+        return np.where(np.all([i >= 0 for i in ids], axis=0), c, -1)
+
+    keys = {
+        0: _find_all(tables[0], code(curr)),
+        2: _find_all(tables[2], code(prev)),
+        3: _find_all(tables[3], code(succ)),
+        4: _find_all(tables[4], code(prev, succ)),
+        5: _find_all(tables[5], code(curr, succ)),
+        6: _find_all(tables[6], code(prev, curr)),
+        7: _find_all(tables[7], code(prev, curr, succ)),
+    }
+    pp_keys = np.array([tables[1].find(tag) for tag in tag_names + [DUMMY]])
+
+    masks = {
+        8: np.array([token[0] == token[0].upper() for token in tokens], dtype=bool),
+        9: np.array([token == token.upper() for token in tokens], dtype=bool),
+        10: np.array([token == token.lower() for token in tokens], dtype=bool),
+        11: first,
+        12: last,
+        13: np.array(['-' in token for token in tokens], dtype=bool),
+    }
+    distributions = {}
+    for f in masks:
+        items = list(tables[f].items())
+        cols = np.array([model.tags.index(tag) for tag, _ in items], dtype=np.int64)
+        distributions[f] = (cols, np.array([prob for _, prob in items], dtype=np.float64))
+
+    output = [[] for _ in sentences]
+    prev_tags = np.full(len(sentences), len(tag_names), dtype=np.int64)  # DUMMY
+
+    for t in range(int(lengths.max(initial=0))):
+        active = np.nonzero(lengths > t)[0]
+        idx = offsets[active] + t
+        n = len(active)
+        scores = np.zeros((n, n_tags))
+        ranks = np.full((n, n_tags), np.iinfo(np.int64).max, dtype=np.int64)
+        rank = 0
+
+        for f, weight in enumerate(weights):
+            if f in masks:
+                cols, probs = distributions[f]
+                rows = np.nonzero(masks[f][idx])[0]
+                r, c = np.repeat(rows, len(cols)), np.tile(cols, len(rows))
+                vals, positions = np.tile(probs, len(rows)), np.tile(np.arange(len(cols)), len(rows))
+            else:
+                k = pp_keys[prev_tags[active]] if f == 1 else keys[f][idx]
+                r, c, vals, positions = _gather(tables[f], k)
+
+            scores[r, c] += vals * weight
+            ranks[r, c] = np.minimum(ranks[r, c], rank + positions)
+            rank += n_tags + 1
+
+        scored = ranks < np.iinfo(np.int64).max
+        masked = np.where(scored, scores, -np.inf)
+        best = masked.max(axis=1, initial=-np.inf)
+        pick = np.where(masked == best[:, None], ranks, np.iinfo(np.int64).max).argmin(axis=1)
+        pick = np.where(scored.any(axis=1), pick, n_tags)
+        prev_tags[active] = pick
+
+        for row, s, p in zip(range(n), active, pick):
+            output[s].append((tag_names[p], float(scores[row, p])) if p < n_tags else ('XX', 0.0))
+
+    return output
+
+
+def percentiles(values: Sequence[float], ps: Sequence[float] = (50, 90, 99)) -> Dict[str, float]:
+    """
+    :return: the nearest-rank percentiles of the values, keyed by 'p50', 'p90', etc.
+    """
+    values = sorted(values)
+    if not values: return {'p{:g}'.format(p): 0.0 for p in ps}
+    return {'p{:g}'.format(p): values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))] for p in ps}
+
+
+class MicroBatcher:
+    """
+    Groups concurrent tagging requests into small batches: a batch is tagged as soon as it has max_batch requests
+    or max_wait seconds have passed since its first request, whichever comes first.
+    """
+
+    def __init__(self, model: Any, max_batch: int = 32, max_wait: float = 0.005):
+        """
+        :param model: a CompactModel, tagged by predict_batch(), or the parameters of predict().
+        :param max_batch: the maximum number of requests per batch.
+        :param max_wait: the maximum number of seconds the first request of a batch waits for others.
+        """
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.latencies = []
+        self.batch_sizes = []
+        # requests queue up from the first tag() call, even if run() has not started yet
+        self._queue = asyncio.Queue()
+
+    def tag_batch(self, sentences: List[List[str]]) -> List[List[Tuple[str, float]]]:
+        if isinstance(self.model, CompactModel):
+            return predict_batch(sentences, self.model)
+        return [predict(tokens, *self.model) for tokens in sentences]
+
+    async def tag(self, tokens: List[str]) -> List[Tuple[str, float]]:
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((tokens, future))
+        try:
+            return await future
+        finally:
+            # failed requests are timed as well, so that the percentiles include them
+            self.latencies.append(time.perf_counter() - start)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0: break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batch_sizes.append(len(batch))
+            try:
+                results = await loop.run_in_executor(None, self.tag_batch, [tokens for tokens, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception:
+                # tag the requests one at a time, so that only the bad ones fail
+                for tokens, future in batch:
+                    try:
+                        future.set_result((await loop.run_in_executor(None, self.tag_batch, [tokens]))[0])
+                    except Exception as e:
+                        future.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        :return: the number of requests and batches, the mean batch size, and the latency percentiles in milliseconds.
+        """
+        stats = {'requests': len(self.latencies), 'batches': len(self.batch_sizes), 'mean_batch': sum(self.batch_sizes) / max(len(self.batch_sizes), 1)}
+        stats.update({p: 1000 * v for p, v in percentiles(self.latencies).items()})
+        return stats
+
+
+async def _respond(batcher: MicroBatcher, line: bytes, number: int, writer) -> None:
+    """
+    Answers one JSON request, either a list of tokens or {"id": ..., "tokens": [...]}, with {"id": ..., "tags": [[tag, score], ...]}.
+    """
+    rid = number
+    try:
+        request = json.loads(line)
+        if isinstance(request, list): request = {'tokens': request}
+        if isinstance(request, dict): rid = request.get('id', number)
+        tokens = request['tokens']
+        if not isinstance(tokens, list) or not tokens or not all(isinstance(token, str) and token for token in tokens):
+            raise ValueError('tokens must be a non-empty list of non-empty strings')
+        response = {'id': rid, 'tags': await batcher.tag(tokens)}
+    except Exception as e:
+        response = {'id': rid, 'error': repr(e)}
+    writer.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+async def _handle(batcher: MicroBatcher, readline: Callable, writer) -> None:
+    # every line is answered by its own task, so requests on the same stream are batched together
+    tasks, number = set(), 0
+
+    while True:
+        line = await readline()
+        if not line: break
+        if not line.strip(): continue
+        task = asyncio.ensure_future(_respond(batcher, line, number, writer))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        number += 1
+
+    if tasks: await asyncio.wait(tasks)
+    if hasattr(writer, 'drain'): await writer.drain()
+
+
+class _StdoutWriter:
+    def write(self, data: bytes):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+
+async def serve(model: Any, socket_path: Optional[str] = None, max_batch: int = 32, max_wait: float = 0.005) -> MicroBatcher:
+    """
+    Serves JSON-lines tagging requests until stdin is closed or, with socket_path, until cancelled.
+    Responses carry the id of their requests (or their line numbers) as they may be returned out of order.
+    :param model: a CompactModel or the parameters of predict().
+    :param socket_path: the path of a local Unix socket to listen on; stdin/stdout is used if not given.
+    :return: the batcher, whose stats() summarizes the batch sizes and latencies.
+    """
+    batcher = MicroBatcher(model, max_batch, max_wait)
+    runner = asyncio.ensure_future(batcher.run())
+
+    try:
+        if socket_path:
+            server = await asyncio.start_unix_server(lambda r, w: _handle(batcher, r.readline, w), path=socket_path)
+            async with server:
+                await server.serve_forever()
+        else:
+            # stdin is read by a thread since it may be a regular file, which the event loop cannot watch
+            loop = asyncio.get_running_loop()
+            await _handle(batcher, lambda: loop.run_in_executor(None, sys.stdin.buffer.readline), _StdoutWriter())
+    finally:
+        runner.cancel()
+        print(json.dumps(batcher.stats()), file=sys.stderr)
+
+    return batcher
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--convert', metavar='FILE', help='converts quiz3.pkl into the compact model FILE and exits')
+    parser.add_argument('--compact', metavar='FILE', help='evaluates the compact model FILE instead of quiz3.pkl')
+    parser.add_argument('--processes', type=int, default=1, help='evaluates in parallel with this many worker processes')
+    parser.add_argument('--serve', action='store_true', help='serves JSON-lines tagging requests on stdin/stdout or --socket')
+    parser.add_argument('--socket', metavar='PATH', help='the Unix socket to serve on')
+    parser.add_argument('--max-batch', type=int, default=32, help='the maximum number of requests tagged together')
+    parser.add_argument('--max-wait', type=float, default=0.005, help='the maximum seconds a request waits for a batch to fill')
+    parser.add_argument('--profile', metavar='FILE', help='profiles the feature lookups of predict() during evaluation and saves the report to FILE')
+    options = parser.parse_args()
+
     path = './../../'  # path to the cs329 directory
+    model_path = path + 'src/quiz/quiz3.pkl'
+
+    if options.convert:
+        convert_model(model_path, options.convert)
+        parser.exit()
+
+    if options.serve:
+        model = load_compact(options.compact) if options.compact else load_args(model_path)
+        try:
+            asyncio.run(serve(model, options.socket, options.max_batch, options.max_wait))
+        except KeyboardInterrupt:
+            pass
+        parser.exit()
+
     trn_data = read_data(path + 'dat/pos/wsj-pos.trn.gold.tsv')
     dev_data = read_data(path + 'dat/pos/wsj-pos.dev.gold.tsv')
-    model_path = path + 'src/quiz/quiz3.pkl'
 
     # save model
     # args = train(trn_data, dev_data)
     # pickle.dump(args, open(model_path, 'wb'))
 
     # load model
-    args = pickle.load(open(model_path, 'rb'))
-    print(evaluate(dev_data, *args))
\ No newline at end of file
+    if options.profile:
+        enable_profiling()
+
+    if options.processes > 1 and not options.profile:
+        report = evaluate_parallel(dev_data, model_path=options.compact or model_path, processes=options.processes)
+        for tag, (correct, total, acc) in report['per_tag'].items():
+            print('{:>6}: {:6.2f}% ({}/{})'.format(tag, acc, correct, total))
+        print('{:.2f}% - {:,.0f} tokens/sec'.format(report['accuracy'], report['tokens_per_sec']))
+    else:
+        args = load_compact(options.compact).args if options.compact else pickle.load(open(model_path, 'rb'))
+        print(evaluate(dev_data, *args))
+
+    if options.profile:
+        profile = disable_profiling()
+        profile.print()
+        profile.save(options.profile)
\ No newline at end of file
@@ -13,22 +13,48 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ========================================================================
+import argparse
 import glob
+import hashlib
+import json
 import os
+import pickle
+import random
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
 from types import SimpleNamespace
-from typing import Iterable, Tuple, Any, List, Set
+from typing import Iterable, Iterator, Tuple, Any, List, Set, Optional, Dict, Union, Sequence
 
 import ahocorasick
+import numpy as np
 
+from quiz1 import map_ordered, read_chunks
 
-def create_ac(data: Iterable[Tuple[str, Any]]) -> ahocorasick.Automaton:
+
+def normalize_text(text: str) -> str:
+    """
+    :return: the text in NFKC with case folded and every run of whitespace collapsed into one space.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+def create_ac(data: Iterable[Tuple[str, Any]], normalize: bool = False) -> ahocorasick.Automaton:
     """
     Creates the Aho-Corasick automation and adds all (span, value) pairs in the data and finalizes this matcher.
     :param data: a collection of (span, value) pairs.
+    :param normalize: if True, spans are added by normalize_text(); match the automaton with normalize=True.
     """
     AC = ahocorasick.Automaton(ahocorasick.STORE_ANY)
 
     for span, value in data:
+        if normalize: span = normalize_text(span)
         if span in AC:
             t = AC.get(span)
         else:
@@ -40,48 +66,458 @@ def create_ac(data: Iterable[Tuple[str, Any]]) -> ahocorasick.Automaton:
     return AC
 
 
-def read_gazetteers(dirname: str) -> ahocorasick.Automaton:
-    data = []
-    for filename in glob.glob(os.path.join(dirname, '*.txt')):
+class Gazetteers:
+    """
+    A finalized Aho-Corasick automaton that stores integer ids and keeps the (span, values) namespaces in tables,
+    so that it pickles in one block instead of one object per node. It answers iter(), get() and `in` like the
+    automaton returned by create_ac(), building each namespace the first time it is matched.
+    """
+
+    def __init__(self, data: Iterable[Tuple[str, Any]], normalize: bool = False):
+        """
+        :param data: a collection of (span, value) pairs.
+        :param normalize: if True, spans are added by normalize_text() and match() normalizes the tokens likewise.
+        """
+        self.normalize = normalize
+        ids, values = dict(), []
+        for span, value in data:
+            if normalize: span = normalize_text(span)
+            i = ids.get(span)
+            if i is None:
+                i = ids[span] = len(values)
+                values.append(set())
+            values[i].add(value)
+
+        self.automaton = ahocorasick.Automaton(ahocorasick.STORE_INTS)
+        for span, i in ids.items():
+            self.automaton.add_word(span, i)
+        self.automaton.make_automaton()
+
+        # value sets are interned because gazetteers share a handful of labels across millions of spans
+        interned = dict()
+        self.spans = list(ids)
+        self.value_sets = []
+        self.value_ids = array('I')
+        for vs in values:
+            key = frozenset(vs)
+            j = interned.get(key)
+            if j is None:
+                j = interned[key] = len(self.value_sets)
+                self.value_sets.append(key)
+            self.value_ids.append(j)
+
+        self._namespaces = dict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_namespaces']
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._namespaces = dict()
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'Gazetteers':
+        # caches store the state rather than the instance, so they load whether this module was run as a script or imported
+        gazetteers = cls.__new__(cls)
+        gazetteers.__setstate__(state)
+        return gazetteers
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def __contains__(self, span: str) -> bool:
+        return (normalize_text(span) if self.normalize else span) in self.automaton
+
+    def namespace(self, i: int) -> SimpleNamespace:
+        t = self._namespaces.get(i)
+        if t is None:
+            t = self._namespaces[i] = SimpleNamespace(span=self.spans[i], values=set(self.value_sets[self.value_ids[i]]))
+        return t
+
+    def get(self, span: str, default: Any = None) -> Any:
+        i = self.automaton.get(normalize_text(span) if self.normalize else span, None)
+        return default if i is None else self.namespace(i)
+
+    def iter(self, text: str) -> Iterator[Tuple[int, SimpleNamespace]]:
+        # make_automaton() leaves an empty trie unfinalized, and iter() raises on it
+        if self.automaton.kind != ahocorasick.AHOCORASICK: return
+        namespaces = self._namespaces
+        for eidx, i in self.automaton.iter(text):
+            yield eidx, namespaces.get(i) or self.namespace(i)
+
+
+CACHE_VERSION = 4
+
+
+def gazetteer_files(dirname: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(dirname, '*.txt')))
+
+
+def gazetteer_hash(dirname: str, normalize: bool = False) -> str:
+    """
+    :return: the SHA-256 digest of the names and contents of the gazetteer files in the directory and the matching mode.
+    """
+    h = hashlib.sha256('{}:{}'.format(CACHE_VERSION, int(normalize)).encode())
+    for filename in gazetteer_files(dirname):
+        h.update(os.path.basename(filename).encode() + b'\0')
+        with open(filename, 'rb') as fin:
+            for block in iter(lambda: fin.read(1 << 20), b''):
+                h.update(block)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def gazetteer_data(dirname: str) -> Iterator[Tuple[str, str]]:
+    """
+    :return: the (span, label) pairs of the gazetteer files in the directory, where the label is the filename.
+    """
+    for filename in gazetteer_files(dirname):
         label = os.path.basename(filename)[:-4]
-        for line in open(filename):
-            data.append((line.strip(), label))
-    return create_ac(data)
+        with open(filename) as fin:
+            for line in fin:
+                yield line.strip(), label
 
 
-def match(AC: ahocorasick.Automaton, tokens: List[str]) -> List[Tuple[str, int, int, Set[str]]]:
+def load_cache(cache: str, digest: str) -> Optional[Gazetteers]:
     """
-    :param AC: the finalized Aho-Corasick automation.
+    :param cache: a file written by read_gazetteers().
+    :param digest: the gazetteer_hash() of the gazetteers the cache must be built from.
+    :return: the matcher in the cache, or None if it is stale or cannot be read (e.g., truncated, or written by an
+             older version of this module), in which case the caller rebuilds it.
+    """
+    try:
+        with open(cache, 'rb') as fin:
+            if pickle.load(fin) != digest: return None
+            return Gazetteers.from_state(pickle.load(fin))
+    except Exception as e:
+        print('Ignoring unreadable gazetteer cache {}: {!r}'.format(cache, e), file=sys.stderr)
+        return None
+
+
+def read_gazetteers(dirname: str, cache: Optional[str] = None, normalize: bool = False) -> Gazetteers:
+    """
+    :param dirname: the directory containing one gazetteer file per label.
+    :param cache: if not None, the file where the finished matcher is saved; it is reused while the content hash
+                  of the gazetteer files stays the same, and rebuilt otherwise.
+    :param normalize: if True, matches case-insensitively after Unicode normalization and whitespace collapsing.
+    :return: the finalized matcher over all gazetteers.
+    """
+    digest = gazetteer_hash(dirname, normalize) if cache else None
+    if cache and os.path.exists(cache):
+        AC = load_cache(cache, digest)
+        if AC is not None: return AC
+
+    AC = Gazetteers(gazetteer_data(dirname), normalize)
+
+    if cache:
+        # write to a temporary file first so that concurrent readers never see a partial cache
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache)))
+        with os.fdopen(fd, 'wb') as fout:
+            # the digest is pickled on its own ahead of the automaton so that a stale cache is detected without loading it
+            pickle.dump(digest, fout, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(AC.__getstate__(), fout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache)
+
+    return AC
+
+
+def scale_gazetteers(dirname: str, outdir: str, copies: int):
+    """
+    Writes every gazetteer entry `copies` times with a numeric suffix to simulate gazetteers of millions of entries.
+    """
+    for filename in gazetteer_files(dirname):
+        with open(filename) as fin:
+            lines = [line.strip() for line in fin]
+        with open(os.path.join(outdir, os.path.basename(filename)), 'w') as fout:
+            for c in range(copies):
+                fout.writelines('{} {}\n'.format(line, c) for line in lines)
+
+
+def cache_times(dirname: str, copies: int = 500) -> Dict[str, float]:
+    """
+    Compares building the matcher from gazetteers scaled by `copies` against loading it from the cache.
+    :return: a dictionary of the number of entries and the seconds for the cold build, the build that writes
+             the cache, and the warm load.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        scale_gazetteers(dirname, tmpdir, copies)
+        cache = os.path.join(tmpdir, 'gazetteers.pkl')
+
+        start = time.perf_counter()
+        AC = read_gazetteers(tmpdir)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        read_gazetteers(tmpdir, cache)
+        save = time.perf_counter() - start
+
+        start = time.perf_counter()
+        read_gazetteers(tmpdir, cache)
+        load = time.perf_counter() - start
+
+        return {'entries': len(AC), 'build': build, 'build_and_save': save, 'load': load}
+
+
+def match(AC: Union[ahocorasick.Automaton, Gazetteers], tokens: List[str], normalize: Optional[bool] = None) -> List[Tuple[str, int, int, Set[str]]]:
+    """
+    :param AC: the finalized Aho-Corasick automation or gazetteers.
     :param tokens: the list of input tokens.
+    :param normalize: whether the tokens are matched by normalize_text(), which must agree with how the automaton
+                      was created (default: the normalize flag of the gazetteers, False for a plain automaton).
     :return: a list of tuples where each tuple consists of
-             - span: str,
+             - span: str, the gazetteer span, or the original tokens joined by spaces when normalized,
              - start token index (inclusive): int
              - end token index (exclusive): int
              - a set of values for the span: Set[str]
     """
-    smap, emap, idx = dict(), dict(), 0
-    for i, token in enumerate(tokens):
-        smap[idx] = i
-        idx += len(token)
-        emap[idx] = i
-        idx += 1
+    if normalize is None: normalize = getattr(AC, 'normalize', False)
+    pieces = [normalize_text(token) for token in tokens] if normalize else tokens
+
+    # token[c] is the index of the token starting at character c of the text, or -1; token[len(text) + 1] is
+    # the number of tokens, so that a match ending right before token e, or at the end of the text, maps to e
+    text = ' '.join(pieces)
+    token = array('i', [-1]) * (len(text) + 2)
+    for i, c in enumerate(accumulate(map((1).__add__, map(len, pieces)), initial=0)):
+        token[c] = i
 
     # find matches
-    text = ' '.join(tokens)
     spans = []
     for eidx, t in AC.iter(text):
-        eidx += 1
-        sidx = eidx - len(t.span)
-        sidx = smap.get(sidx, None)
-        eidx = emap.get(eidx, None)
-        if sidx is None or eidx is None: continue
-        spans.append((t.span, sidx, eidx + 1, t.values))
+        e = token[eidx + 2]
+        s = token[eidx + 1 - len(t.span)]
+        if s < 0 or e < 0: continue
+        spans.append((' '.join(tokens[s:e]) if normalize else t.span, s, e, t.values))
 
     return spans
 
 
+_AC: Optional[Gazetteers] = None
+
+
+def _init_match(dirname: str, cache: Optional[str], normalize: bool = False):
+    global _AC
+    _AC = read_gazetteers(dirname, cache, normalize)
+
+
+def _match_chunk(documents: List[List[str]]) -> List[List[Tuple[str, int, int, Set[str]]]]:
+    return [match(_AC, tokens) for tokens in documents]
+
+
+def match_many(documents: Iterable[List[str]], dirname: str, cache: Optional[str] = None, processes: Optional[int] = None, chunk_size: int = 100, normalize: bool = False) -> Iterator[List[Tuple[str, int, int, Set[str]]]]:
+    """
+    Matches a stream of documents in a process pool (see quiz1.map_ordered()) whose workers each load the gazetteers once.
+    :param documents: a stream of token lists.
+    :param dirname: the gazetteer directory passed to read_gazetteers().
+    :param cache: the gazetteer cache passed to read_gazetteers(); with a warm cache, each worker starts in milliseconds.
+    :param processes: the number of worker processes (default: #cpus); 1 matches in this process.
+    :param chunk_size: the number of documents per task.
+    :param normalize: if True, matches case-insensitively after Unicode normalization and whitespace collapsing.
+    :return: the matches of each document, in the order of the documents.
+    """
+    processes = processes or os.cpu_count() or 1
+    chunks = read_chunks(documents, chunk_size)
+
+    if processes == 1:
+        _init_match(dirname, cache, normalize)
+        for chunk in chunks:
+            yield from _match_chunk(chunk)
+        return
+
+    for matches in map_ordered(_match_chunk, chunks, processes, _init_match, (dirname, cache, normalize)):
+        yield from matches
+
+
+def match_file(input_path: str, output_path: str, dirname: str, cache: Optional[str] = None, processes: Optional[int] = None, chunk_size: int = 100, report_every: float = 10.0, normalize: bool = False) -> Tuple[int, float]:
+    """
+    Matches every line of the input file as a whitespace-tokenized document and writes one JSON line per document
+    with its entities as [span, start, end, sorted values], reporting documents per second to stderr.
+    :return: the number of documents and the seconds elapsed.
+    """
+    docs = 0
+    start = last = time.time()
+
+    with open(input_path) as fin, open(output_path, 'w') as fout:
+        for entities in match_many((line.split() for line in fin), dirname, cache, processes, chunk_size, normalize):
+            fout.write(json.dumps([[span, s, e, sorted(values)] for span, s, e, values in entities]) + '\n')
+            docs += 1
+
+            now = time.time()
+            if now - last >= report_every:
+                print('{:,} docs, {:,.0f} docs/sec'.format(docs, docs / (now - start)), file=sys.stderr)
+                last = now
+
+    elapsed = time.time() - start
+    print('{:,} docs in {:.2f} sec, {:,.0f} docs/sec'.format(docs, elapsed, docs / elapsed if elapsed else 0.0), file=sys.stderr)
+    return docs, elapsed
+
+
+_live_entries: Dict[str, Set[str]] = dict()
+
+
+def _apply_batch(entries: Dict[str, Set[str]], add: bool, pairs: Iterable[Tuple[str, str]]):
+    for span, label in pairs:
+        if add:
+            entries.setdefault(span, set()).add(label)
+        else:
+            labels = entries.get(span)
+            if labels is None: continue
+            labels.discard(label)
+            if not labels: del entries[span]
+
+
+def _init_live(data: List[Tuple[str, str]]):
+    _live_entries.clear()
+    _apply_batch(_live_entries, True, data)
+
+
+def _rebuild_live(batches: List[Tuple[bool, List[Tuple[str, str]]]], normalize: bool) -> bytes:
+    # the batches are applied to a copy that replaces the entries only once the rebuild succeeds
+    global _live_entries
+    entries = {span: set(labels) for span, labels in _live_entries.items()}
+    for add, pairs in batches:
+        _apply_batch(entries, add, pairs)
+    data = ((span, label) for span, labels in entries.items() for label in labels)
+    state = pickle.dumps(Gazetteers(data, normalize).__getstate__(), protocol=pickle.HIGHEST_PROTOCOL)
+    _live_entries = entries
+    return state
+
+
+class LiveMatcher:
+    """
+    Gazetteers that take batches of (span, label) pairs to add or remove while serving match().
+    A worker process keeps its own copy of the entries and rebuilds the automaton, so the long C calls of the build
+    never hold this process's GIL; a background thread sends it every batch that arrived since the last rebuild,
+    unpickles the result, and swaps it in with a single assignment. match() calls keep using the previous automaton
+    until then, and never take a lock. If a rebuild fails, its batches are dropped, the worker is restarted from the
+    raw entries of the served automaton, which this process keeps as well, and the error is raised by the next
+    wait(), add() or remove().
+    """
+
+    def __init__(self, data: Iterable[Tuple[str, str]] = (), normalize: bool = False):
+        data = list(data)
+        self.normalize = normalize
+        self.gazetteers = Gazetteers(data, normalize)
+        # the spans as given rather than normalized, which add() and remove() are keyed by
+        self._entries: Dict[str, Set[str]] = dict()
+        _apply_batch(self._entries, True, data)
+        self.rebuilds: List[Tuple[int, float]] = []
+
+        self._batches: List[Tuple[bool, List[Tuple[str, str]]]] = []
+        self._version = self._built = 0
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._changed = threading.Condition()
+        self._pool = ProcessPoolExecutor(1, initializer=_init_live, initargs=(data,))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _raise(self):
+        # called with the condition held
+        error, self._error = self._error, None
+        if error is not None: raise error
+
+    def _submit(self, add: bool, pairs: Iterable[Tuple[str, str]]):
+        pairs = list(pairs)
+        for pair in pairs:
+            if not (isinstance(pair, tuple) and len(pair) == 2 and isinstance(pair[0], str) and pair[0]):
+                raise TypeError('expected a (span, label) pair with a non-empty string span: {!r}'.format(pair))
+
+        with self._changed:
+            self._raise()
+            self._batches.append((add, pairs))
+            self._version += 1
+            self._changed.notify_all()
+
+    def add(self, pairs: Iterable[Tuple[str, str]]):
+        self._submit(True, pairs)
+
+    def remove(self, pairs: Iterable[Tuple[str, str]]):
+        self._submit(False, pairs)
+
+    def match(self, tokens: List[str]) -> List[Tuple[str, int, int, Set[str]]]:
+        return match(self.gazetteers, tokens)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until every batch added or removed so far is in the served automaton, or its rebuild failed.
+        :return: False if the timeout expired first.
+        """
+        with self._changed:
+            done = self._changed.wait_for(lambda: self._built == self._version, timeout)
+            self._raise()
+            return done
+
+    def close(self):
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join()
+        self._pool.shutdown()
+
+    def _run(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._closed or self._built != self._version)
+                if self._closed: return
+                version, batches, self._batches = self._version, self._batches, []
+
+            start = time.perf_counter()
+            try:
+                gazetteers = Gazetteers.from_state(pickle.loads(self._pool.submit(_rebuild_live, batches, self.normalize).result()))
+            except Exception as e:
+                # the worker may hold partial entries or be gone (e.g., BrokenProcessPool), so restart it from the served ones
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = ProcessPoolExecutor(1, initializer=_init_live, initargs=([(span, label) for span, labels in self._entries.items() for label in labels],))
+                with self._changed:
+                    self._error = e
+                    self._built = version
+                    self._changed.notify_all()
+                continue
+            seconds = time.perf_counter() - start
+
+            for add, pairs in batches:
+                _apply_batch(self._entries, add, pairs)
+
+            with self._changed:
+                self.gazetteers = gazetteers
+                self.rebuilds.append((len(gazetteers), seconds))
+                self._built = version
+                self._changed.notify_all()
+
+
+def rebuild_times(dirname: str, copies: Iterable[int] = (1, 10, 100, 500), batch_size: int = 1000) -> List[Tuple[int, float, float]]:
+    """
+    Measures LiveMatcher rebuilds against gazetteers scaled by each number of copies (see scale_gazetteers()),
+    each after adding one batch of new entries, while this thread keeps matching.
+    :return: a list of (number of entries, seconds to rebuild and swap, slowest match() call in seconds during the rebuild).
+    """
+    base = list(gazetteer_data(dirname))
+    tokens = ' '.join(span for span, _ in base[:20]).split()
+    times = []
+
+    for c in copies:
+        live = LiveMatcher(('{} {}'.format(span, i), label) for i in range(c) for span, label in base)
+        start = time.perf_counter()
+        live.add(('new entry {}'.format(i), 'new') for i in range(batch_size))
+
+        slowest = 0.0
+        while not live.wait(0):
+            t = time.perf_counter()
+            live.match(tokens)
+            slowest = max(slowest, time.perf_counter() - t)
+
+        times.append((len(live.gazetteers), time.perf_counter() - start, slowest))
+        live.close()
+
+    return times
+
+
 def remove_overlaps(entities: List[Tuple[str, int, int, Set[str]]]) -> List[Tuple[str, int, int, Set[str]]]:
     """
+    Finds the non-overlapping subset of the entities with the most entities, then the most covered tokens,
+    by weighted interval scheduling in O(n log n).
     :param entities: a list of tuples where each tuple consists of
              - span: str,
              - start token index (inclusive): int
@@ -90,24 +526,59 @@ def remove_overlaps(entities: List[Tuple[str, int, int, Set[str]]]) -> List[Tupl
     :return: a list of entities where each entity is represented by a tuple of (span, start index, end index, value set)
     """
     entities.sort(key=lambda x: x[2])
-    sublists = []
+    ends = [entity[2] for entity in entities]
 
-    def aux(end, sub):
-        for entity in entities:
-            s = entity[1]
-            e = entity[2]
+    # best[j] = (number of entities, covered tokens) of the best subset among the first j entities
+    best = [(0, 0)]
+    prev = []
+    for j, (_, s, e, _) in enumerate(entities):
+        p = bisect_right(ends, s, 0, j)
+        prev.append(p)
+        take = (best[p][0] + 1, best[p][1] + e - s)
+        best.append(max(take, best[j]))
 
-            if end <= s:
-                aux(e, sub + [entity])
-            else:
-                sublists.append(sub)
+    subset, j = [], len(entities)
+    while j > 0:
+        if best[j] == best[j-1]:
+            j -= 1
+        else:
+            subset.append(entities[j-1])
+            j = prev[j-1]
 
-    aux(-1, [])
+    subset.reverse()
+    return subset
 
-    keys = {(len(sublist), sum([entity[2] - entity[1] for entity in sublist])): sublist for sublist in sublists}
-    key = sorted(keys.keys())[-1]
 
-    return keys[key]
+def random_entities(size: int, doc_length: Optional[int] = None, max_width: int = 5, seed: int = 0) -> List[Tuple[str, int, int, Set[str]]]:
+    """
+    :param size: the number of candidate spans.
+    :param doc_length: the number of tokens in the document; defaults to the size.
+    :param max_width: the maximum number of tokens in a span.
+    :param seed: the random seed.
+    :return: randomly placed, mostly overlapping candidate spans in a document.
+    """
+    rand = random.Random(seed)
+    doc_length = doc_length or size
+    entities = []
+    for i in range(size):
+        s = rand.randrange(doc_length)
+        e = min(doc_length, s + rand.randint(1, max_width))
+        entities.append(('e{}'.format(i), s, e, {'label'}))
+    return entities
+
+
+def overlap_times(sizes: Iterable[int] = (1000, 5000, 20000, 100000)) -> List[Tuple[int, int, float]]:
+    """
+    Benchmarks remove_overlaps() on documents with increasing numbers of candidate spans.
+    :return: a list of (number of candidate spans, number of selected spans, seconds).
+    """
+    times = []
+    for size in sizes:
+        entities = random_entities(size)
+        start = time.perf_counter()
+        selected = remove_overlaps(entities)
+        times.append((size, len(selected), time.perf_counter() - start))
+    return times
 
 
 def to_bilou(tokens: List[str], entities: List[Tuple[str, int, int, str]]) -> List[str]:
@@ -139,9 +610,126 @@ def to_bilou(tokens: List[str], entities: List[Tuple[str, int, int, str]]) -> Li
     return tags
 
 
+def bilou_tags(labels: Sequence[str]) -> List[str]:
+    """
+    :param labels: the entity labels, where label k is encoded as B=1+4k, I=2+4k, L=3+4k and U=4+4k, and O as 0.
+    :return: the BILOU tag of every id, so that bilou_tags(labels)[i] is the string that to_bilou() would emit for id i.
+    """
+    return ['O'] + ['{}-{}'.format(prefix, label) for label in labels for prefix in 'BILU']
+
+
+def encode_bilou(documents: Sequence[Tuple[Sequence[str], Sequence[Tuple[str, int, int, str]]]], labels: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes the BILOU tags of a whole corpus into one preallocated array of tag ids (see bilou_tags()).
+    :param documents: a list of (tokens, entities) where the entities of each document do not overlap, e.g., after remove_overlaps().
+    :param labels: the entity labels.
+    :return: (tags, offsets) where tags[offsets[d]:offsets[d+1]] are the tag ids of document d.
+    """
+    label_ids = {label: k for k, label in enumerate(labels)}
+    dtype = np.uint8 if 4 * len(labels) < 256 else np.uint16 if 4 * len(labels) < 65536 else np.uint32
+
+    offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+    np.cumsum([len(tokens) for tokens, _ in documents], out=offsets[1:])
+    tags = np.zeros(offsets[-1], dtype=dtype)
+
+    starts, ends, ids = [], [], []
+    for (_, entities), offset in zip(documents, offsets.tolist()):
+        for entity in entities:
+            starts.append(offset + entity[1])
+            ends.append(offset + entity[2])
+            ids.append(label_ids[entity[3]])
+    if not ids: return tags, offsets
+
+    starts, ends = np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+    base = 4 * np.array(ids, dtype=dtype)
+
+    # inside tokens: every position in [start + 1, end - 1), expanded per entity without a Python loop
+    inside = np.maximum(ends - starts - 2, 0)
+    firsts = np.repeat(starts + 1 - np.cumsum(inside) + inside, inside)
+    tags[firsts + np.arange(len(firsts))] = np.repeat(base + 2, inside)
+
+    unit = ends - starts == 1
+    tags[starts[unit]] = base[unit] + 4
+    tags[starts[~unit]] = base[~unit] + 1
+    tags[ends[~unit] - 1] = base[~unit] + 3
+    return tags, offsets
+
+
+def decode_bilou(tags: np.ndarray, labels: Sequence[str], offsets: Optional[np.ndarray] = None, tokens: Optional[Sequence[Sequence[str]]] = None) -> List[List[Tuple[Optional[str], int, int, str]]]:
+    """
+    Decodes the tag ids of a corpus back to entities. Only well-formed entities are returned: U, or B followed by
+    any number of I and then L, all with the same label; other tags are ignored.
+    :param tags: the tag ids (see bilou_tags()).
+    :param labels: the entity labels.
+    :param offsets: the document boundaries returned by encode_bilou() (default: the tags form one document).
+    :param tokens: if not None, the tokens of each document, used to fill in the spans; otherwise, spans are None.
+    :return: the entities (span, start, end, label) of each document, where start and end are relative to the document.
+    """
+    tags = np.asarray(tags, dtype=np.int64)
+    if offsets is None: offsets = np.array([0, len(tags)], dtype=np.int64)
+    role, label = (tags - 1) % 4, (tags - 1) // 4  # 0: B, 1: I, 2: L, 3: U, where tags > 0
+
+    # cont[i]: token i continues an entity opened at token i-1 within the same document
+    cont = np.zeros(len(tags), dtype=bool)
+    cont[1:] = (tags[1:] > 0) & (tags[:-1] > 0) & ((role[1:] == 1) | (role[1:] == 2)) & ((role[:-1] == 0) | (role[:-1] == 1)) & (label[1:] == label[:-1])
+    cont[offsets[:-1][offsets[:-1] < len(tags)]] = False
+    broken = np.concatenate(([0], np.cumsum(~cont)))
+
+    begins = np.flatnonzero((tags > 0) & (role == 0))
+    lasts = np.flatnonzero((tags > 0) & (role == 2))
+    following = np.searchsorted(lasts, begins)
+    has_last = following < len(lasts)
+    begins, lasts = begins[has_last], lasts[following[has_last]]
+    valid = broken[lasts + 1] - broken[begins + 1] == 0
+
+    starts = np.concatenate((begins[valid], np.flatnonzero((tags > 0) & (role == 3))))
+    ends = np.concatenate((lasts[valid] + 1, np.flatnonzero((tags > 0) & (role == 3)) + 1))
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    docs = np.searchsorted(offsets, starts, side='right') - 1
+
+    entities = [[] for _ in range(len(offsets) - 1)]
+    for d, s, e, k in zip(docs.tolist(), starts.tolist(), ends.tolist(), label[starts].tolist()):
+        s, e = s - int(offsets[d]), e - int(offsets[d])
+        span = ' '.join(tokens[d][s:e]) if tokens is not None else None
+        entities[d].append((span, s, e, labels[k]))
+    return entities
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--benchmark', action='store_true', help='times remove_overlaps() on thousands of candidate spans')
+    parser.add_argument('--cache', help='the file caching the finished gazetteer matcher')
+    parser.add_argument('--cache-benchmark', type=int, metavar='COPIES', help='compares building and loading gazetteers scaled by COPIES')
+    parser.add_argument('--match', metavar='INPUT', help='matches every line of INPUT as a document and writes JSON lines')
+    parser.add_argument('-o', '--output', help='the JSON lines output of --match (default: INPUT.json)')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='the number of worker processes for --match (default: #cpus)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=100, help='the number of documents per task for --match')
+    parser.add_argument('--live-benchmark', action='store_true', help='reports live gazetteer rebuild times against gazetteer size')
+    parser.add_argument('-n', '--normalize', action='store_true', help='matches case-insensitively after Unicode normalization')
+    options = parser.parse_args()
     gaz_dir = './../../dat/ner'
-    AC = read_gazetteers(gaz_dir)
+
+    if options.live_benchmark:
+        for entries, seconds, slowest in rebuild_times(gaz_dir):
+            print('{:>10,} entries: rebuilt in {:.3f} sec, slowest match {:.2f} ms'.format(entries, seconds, slowest * 1000))
+        raise SystemExit
+
+    if options.match:
+        match_file(options.match, options.output or options.match + '.json', gaz_dir, options.cache, options.processes, options.chunk_size, normalize=options.normalize)
+        raise SystemExit
+
+    if options.benchmark:
+        for size, selected, seconds in overlap_times():
+            print('{:>8,} spans -> {:>6,} selected: {:.4f} sec'.format(size, selected, seconds))
+        raise SystemExit
+
+    if options.cache_benchmark:
+        times = cache_times(gaz_dir, options.cache_benchmark)
+        print('{entries:,} entries: build {build:.2f} sec, build and save {build_and_save:.2f} sec, load {load:.3f} sec'.format(**times))
+        raise SystemExit
+
+    AC = read_gazetteers(gaz_dir, options.cache, options.normalize)
 
     tokens = 'Atlantic City of Georgia'.split()
     entities = match(AC, tokens)
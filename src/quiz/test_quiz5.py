@@ -0,0 +1,53 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import quiz5
+
+
+def test_empty_live_matcher():
+    live = quiz5.LiveMatcher()
+    try:
+        assert live.match(['Atlanta']) == []
+    finally:
+        live.close()
+
+
+def test_emptied_live_matcher():
+    live = quiz5.LiveMatcher([('Atlanta', 'us_city')])
+    try:
+        assert [span for span, _, _, _ in live.match(['Atlanta'])] == ['Atlanta']
+        live.remove([('Atlanta', 'us_city')])
+        live.wait()
+        assert len(live.gazetteers) == 0
+        assert live.match(['Atlanta']) == []
+    finally:
+        live.close()
+
+
+def test_live_matcher_recovers_raw_entries():
+    live = quiz5.LiveMatcher([('Atlanta', 'us_city'), ('Boston', 'us_city')], normalize=True)
+    try:
+        live.add([('Foo', ['unhashable'])])
+        try:
+            live.wait()
+            assert False, 'the failed rebuild must raise'
+        except TypeError:
+            pass
+        live.remove([('Atlanta', 'us_city')])
+        live.wait()
+        assert live.match(['atlanta']) == []
+        assert [span for span, _, _, _ in live.match(['boston'])] == ['boston']
+    finally:
+        live.close()